@@ -0,0 +1,44 @@
+# %%
+from timeit import timeit
+import numpy as np
+import pandas as pd
+from self_tracking.importers.apple_health import parse_dates
+
+# %%
+# Synthetic endDate strings in the export's format, about the size of a few
+# years of dietary records.
+count = 200_000
+rng = np.random.default_rng(0)
+seconds = rng.integers(0, 5 * 365 * 24 * 60 * 60, count)
+end_dates = pd.Series(
+    (pd.Timestamp("2020-01-01") + pd.to_timedelta(seconds, unit="s")).strftime(
+        "%Y-%m-%d %H:%M:%S +0100"
+    )
+)
+
+
+# %%
+# Before: one pd.to_datetime call per record, as gather_records used to do for
+# each XML node. Timed on a sample since the full column takes minutes.
+sample = end_dates[:5_000]
+before = timeit(
+    lambda: [pd.to_datetime(x, utc=True).date() for x in sample], number=1
+) / len(sample)
+
+# After: the whole column in one pass with a fixed format.
+after = timeit(
+    lambda: parse_dates(end_dates).dt.tz_localize(None).dt.normalize(), number=1
+) / len(end_dates)
+
+print(f"Per record before: {before * 1e6:.2f}µs")
+print(f"Per record after:  {after * 1e6:.3f}µs")
+print(f"Speedup: {before / after:.0f}x")
+
+
+# %%
+# Both give the same dates.
+expected = pd.to_datetime(
+    pd.Series([pd.to_datetime(x, utc=True).date() for x in sample])
+)
+actual = parse_dates(sample).dt.tz_localize(None).dt.normalize()
+assert (expected == actual).all()
@@ -0,0 +1,62 @@
+# %%
+from timeit import timeit
+import numpy as np
+import pandas as pd
+import self_tracking.data as d
+
+
+# %%
+# The original minute-by-minute loop, kept as a reference.
+def reference_heatmap(events, categories):
+    minutes_in_day = 24 * 60
+    heatmap = pd.DataFrame(0, index=range(minutes_in_day), columns=categories)
+
+    for event in events.itertuples():
+        start_minute = event.start.hour * 60 + event.start.minute
+        num_minutes = round(event.duration * 60)
+        for minute in range(start_minute, start_minute + num_minutes):
+            heatmap.loc[minute % minutes_in_day, event.category] += 1
+
+    return heatmap
+
+
+# %%
+# Same output on the real data.
+categories = list(d.atracker_categories().index)
+events = d.atracker_events("2020-05-04")
+expected = reference_heatmap(events, categories)
+actual = d.atracker_heatmap.__wrapped__("2020-05-04")
+pd.testing.assert_frame_equal(expected, actual)
+
+
+# %%
+# And on synthetic events that wrap past midnight, last several days, last
+# exactly a day, or have no length at all.
+def synthetic_events(count, seed=0):
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp("2023-01-01", tz="Europe/London") + pd.to_timedelta(
+        rng.integers(0, 365 * 24 * 60, count), unit="min"
+    )
+    duration = rng.choice([0, 1 / 60, 0.5, 3, 23.99, 24, 30, 50], count)
+    category = rng.choice(categories, count)
+    return pd.DataFrame({"start": start, "duration": duration, "category": category})
+
+
+synthetic = synthetic_events(200)
+synthetic["date"] = pd.to_datetime((synthetic.start - pd.Timedelta(hours=6)).dt.date)
+pd.testing.assert_frame_equal(
+    reference_heatmap(synthetic, categories),
+    d.heatmap_counts(d.heatmap_marks(synthetic, categories), categories),
+)
+
+
+# %%
+before = timeit(lambda: reference_heatmap(events, categories), number=1)
+after = timeit(lambda: d.atracker_heatmap.__wrapped__("2020-05-04"), number=10) / 10
+rebuild = timeit(lambda: d.heatmap_marks(events, categories), number=10) / 10
+
+print(f"Events: {len(events)}")
+print(f"Before: {before:.2f}s")
+print(f"After:  {after * 1000:.1f}ms")
+print(f"Rebuilding the stored marks: {rebuild * 1000:.1f}ms")
+print(f"Speedup: {before / after:.0f}x")
@@ -0,0 +1,41 @@
+# %%
+import json
+import pandas as pd
+import plotly.express as px
+from self_tracking.importers.metrics import history_path
+
+# %%
+# One row per stage per run of importers/all.
+runs = [json.loads(line) for line in history_path.read_text().splitlines()]
+df = pd.DataFrame(
+    {"started": pd.Timestamp(run["started"]), **stage}
+    for run in runs
+    for stage in run["stages"]
+)
+df["peak_rss_mb"] = df.peak_rss / 2**20
+df["stage"] = df.parent.fillna("").str.cat(df["name"], sep="/").str.lstrip("/")
+
+# %%
+totals = pd.DataFrame(
+    {"started": pd.Timestamp(run["started"]), "wall": run["wall"]} for run in runs
+)
+px.line(totals, x="started", y="wall", markers=True, title="Whole import (s)")
+
+# %%
+importers = df.loc[df.parent.isna()]
+px.line(importers, x="started", y="wall", color="stage", markers=True)
+
+# %%
+steps = df.loc[df.parent.notna()]
+px.line(steps, x="started", y="wall", color="stage", markers=True)
+
+# %%
+px.line(importers, x="started", y="peak_rss_mb", color="stage", markers=True)
+
+# %%
+# The slowest stages of the latest run against their median over earlier runs.
+latest = df.loc[df.started == df.started.max()].set_index("stage")
+median = df.loc[df.started < df.started.max()].groupby("stage").wall.median()
+pd.DataFrame({"latest": latest.wall, "median": median}).dropna().assign(
+    ratio=lambda x: x.latest / x["median"]
+).sort_values("ratio", ascending=False)
@@ -0,0 +1,70 @@
+# %%
+from timeit import timeit
+import numpy as np
+import pandas as pd
+import self_tracking.data as d
+from self_tracking.intervals import Intervals
+
+
+# %%
+# The dense windows x events version the Home page used to have, kept as a
+# reference. Everything here is in float hours.
+def reference_overlap(starts, ends, lo, hi):
+    lo, hi = np.atleast_1d(lo), np.atleast_1d(hi)
+    if len(starts) == 0:
+        return np.zeros(len(hi))
+    inside = np.minimum(ends[None, :], hi[:, None]) - np.maximum(
+        starts[None, :], lo[:, None]
+    )
+    return np.clip(inside, 0, None).sum(axis=1)
+
+
+def check(starts, ends, lo, hi):
+    expected = reference_overlap(starts, ends, lo, hi)
+    actual = Intervals.of(starts, ends).overlap(lo, hi)
+    np.testing.assert_allclose(actual, expected, rtol=0, atol=1e-6)
+
+
+# %%
+# Random overlapping events, including empty and backwards ones, against
+# windows that are empty, backwards, shared-origin or far outside the events.
+rng = np.random.default_rng(0)
+for _ in range(200):
+    count = rng.integers(0, 50)
+    starts = 450_000 + rng.uniform(0, 24 * 7 * 4, count)
+    ends = starts + rng.choice([-1, 0, 0.1, 1, 5, 30], count)
+    lo = 450_000 + rng.uniform(-100, 24 * 7 * 5, 30)
+    hi = lo + rng.uniform(-5, 24 * 7, 30)
+    check(starts, ends, lo, hi)
+    check(starts, ends, lo[:1], np.sort(hi))
+    check(starts, ends, lo.min(), hi)
+
+
+# %%
+# Real events, against the weekly bars and a daily burn-up grid.
+def to_hours(values):
+    index = pd.DatetimeIndex(values)
+    return index.to_numpy().astype("datetime64[s]").astype(np.int64) / 3600
+
+
+events = d.atracker_events("2020-05-04")
+start = pd.DatetimeIndex(events.start).tz_localize(None)
+end = start + pd.to_timedelta(events.duration, unit="h")
+starts, ends = to_hours(start), to_hours(end)
+
+weeks = pd.date_range("2020-05-04", end.max(), freq="7D")
+grid = pd.date_range("2020-05-04", end.max(), freq="15min")
+
+check(starts, ends, to_hours(weeks), to_hours(weeks + pd.Timedelta(days=7)))
+check(starts, ends, to_hours(grid[:1]), to_hours(grid[:2000]))
+
+
+# %%
+lo, hi = to_hours(grid[:1]), to_hours(grid[:5000])
+before = timeit(lambda: reference_overlap(starts, ends, lo, hi), number=3) / 3
+after = timeit(lambda: Intervals.of(starts, ends).overlap(lo, hi), number=10) / 10
+
+print(f"Events: {len(starts)}, windows: {len(hi)}")
+print(f"Before: {before * 1000:.1f}ms")
+print(f"After:  {after * 1000:.2f}ms")
+print(f"Speedup: {before / after:.0f}x")
@@ -0,0 +1,48 @@
+# %%
+from pathlib import Path
+from tempfile import TemporaryDirectory
+import pandas as pd
+import self_tracking.importers.upsert as upsert
+
+# %%
+# The incremental import only has calories for diet.tsv, which Apple Health
+# writes with every macro. Checked against a scratch copy in that shape.
+tmp = TemporaryDirectory()
+upsert.diary_dir = Path(tmp.name)
+upsert.index_dir = Path(tmp.name) / "keys"
+
+diet = upsert.Dataset("diet", keys=["date"], sort_by="date")
+diet.file.parent.mkdir(parents=True)
+diet.file.write_text(
+    "date\tcalories\tprotein\tfat\tcarbs\tsugar\tfiber\n"
+    "2024-03-01\t2100\t120.5\t80.2\t210.0\t60.1\t30.4\n"
+    "2024-03-03\t1900\t110.0\t70.0\t200.0\t50.0\t25.0\n"
+)
+
+# %%
+eaten = pd.DataFrame(
+    {"date": ["2024-03-03", "2024-03-04", "2024-03-05"], "calories": [1, 2000, 2200]}
+)
+assert diet.upsert(eaten) == 2
+assert diet.file.read_text().splitlines()[-2:] == [
+    "2024-03-04\t2000\t\t\t\t\t",
+    "2024-03-05\t2200\t\t\t\t\t",
+]
+
+# %%
+# Filling in a gap rewrites the file in date order.
+assert diet.upsert(pd.DataFrame({"date": ["2024-03-02"], "calories": [1800]})) == 1
+df = pd.read_table(diet.file, dtype=str, keep_default_na=False)
+assert list(df.date) == sorted(df.date)
+assert df.set_index("date").loc["2024-03-02"].tolist() == ["1800", "", "", "", "", ""]
+assert df.set_index("date").loc["2024-03-03", "calories"] == "1900"
+
+# %%
+# Columns the file doesn't have are still refused.
+try:
+    diet.upsert(pd.DataFrame({"date": ["2024-03-06"], "water": [1]}))
+    raise AssertionError("expected unknown columns to be refused")
+except Exception as e:
+    assert "don't match" in str(e)
+
+tmp.cleanup()
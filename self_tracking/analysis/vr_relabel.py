@@ -1,33 +1,20 @@
-from pathlib import Path
 from typing import Any, cast
-import xml.etree.ElementTree as ET
-from zipfile import ZipFile
 import pandas as pd
 import self_tracking.data as d
+from self_tracking.importers.apple_health import load_export
 import plotly.express as px
 
-
 # %%
-def getroot() -> ET.Element:
-    with ZipFile(Path("~/.cache/apple-health-export.zip").expanduser()) as zf:
-        return ET.parse(zf.open("apple_health_export/export.xml")).getroot()
-
-
-root = getroot()
+active_energy = "HKQuantityTypeIdentifierActiveEnergyBurned"
+records = load_export([active_energy]).find(active_energy)
 
-
-# %%
-activity = pd.DataFrame(
-    {
-        "start": node.attrib["startDate"],
-        "end": node.attrib["endDate"],
-        "value": float(node.attrib["value"]),
-    }
-    for node in root.iterfind(
-        f"./Record[@type='HKQuantityTypeIdentifierActiveEnergyBurned']"
-    )
-    if node.attrib["sourceName"] == "David’s Apple\xa0Watch"
-    and node.attrib["unit"] == "Cal"
+activity = (
+    records.loc[
+        (records.sourceName == "David’s Apple\xa0Watch") & (records.unit == "Cal"),
+        ["startDate", "endDate", "value"],
+    ]
+    .set_axis(["start", "end", "value"], axis=1)
+    .reset_index(drop=True)
 )
 
 
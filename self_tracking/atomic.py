@@ -0,0 +1,37 @@
+from contextlib import contextmanager
+import os
+from pathlib import Path
+import tempfile
+
+# mkstemp makes files only their owner can read, so they get the usual
+# permissions before being renamed into place.
+umask = os.umask(0)
+os.umask(umask)
+
+
+@contextmanager
+def atomic_path(path: Path):
+    """A temporary file beside `path` for the block to write, renamed over
+    `path` if the block finishes, so readers never see half a file.
+
+    Each call gets its own temporary file, so threads or processes writing the
+    same path at once don't trip over each other. The last one to finish wins.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    os.close(fd)
+    tmp_path = Path(name)
+    try:
+        tmp_path.chmod(0o666 & ~umask)
+        yield tmp_path
+        tmp_path.replace(path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+def write_atomic(path: Path, contents: str | bytes | bytearray):
+    with atomic_path(path) as tmp_path:
+        if isinstance(contents, (bytes, bytearray)):
+            tmp_path.write_bytes(contents)
+        else:
+            tmp_path.write_text(contents)
@@ -2,6 +2,8 @@ import dash
 from dash._dash_renderer import _set_react_version
 from dash import page_registry, page_container
 import dash_mantine_components as dmc
+import self_tracking.data as d
+from self_tracking.dashboard.figure_cache import cache_info
 
 _set_react_version("18.2.0")
 
@@ -35,5 +37,10 @@ app.layout = dmc.MantineProvider(
 )
 
 
+@app.server.route("/debug/cache")
+def debug_cache():
+    return {"figures": cache_info(), "accessors": d.memo_info()}
+
+
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,66 @@
+import json
+import threading
+from collections import OrderedDict
+from functools import wraps
+from pathlib import Path
+
+from plotly.io.json import to_json_plotly
+
+import self_tracking.data as d
+
+# Total size of the serialized responses kept, least recently used dropped first.
+BUDGET_BYTES = 64 * 1024 * 1024
+
+responses: OrderedDict[tuple, tuple[set[Path], tuple, str]] = OrderedDict()
+stats = {"hits": 0, "misses": 0, "evictions": 0, "bytes": 0}
+lock = threading.Lock()
+
+
+def cached(func):
+    """Keep a page callback's response until its inputs or the data files it
+    read change.
+
+    Goes under `@dash.callback`. Responses are kept as the JSON Dash would send
+    and handed back parsed on a hit, which skips building the figure and
+    converting its arrays.
+    """
+
+    @wraps(func)
+    def wrapper(*args):
+        key = (func.__module__, func.__name__, json.dumps(args, default=str))
+
+        with lock:
+            found = responses.get(key)
+        if found and found[1] == d.files_version(found[0]):
+            with lock:
+                if key in responses:
+                    responses.move_to_end(key)
+                stats["hits"] += 1
+            return json.loads(found[2])
+
+        with d.tracking() as files:
+            result = func(*args)
+        text = to_json_plotly(result)
+
+        with lock:
+            stats["misses"] += 1
+            if key in responses:
+                stats["bytes"] -= len(responses.pop(key)[2])
+            responses[key] = (files, d.files_version(files), text)
+            stats["bytes"] += len(text)
+            while stats["bytes"] > BUDGET_BYTES and len(responses) > 1:
+                stats["bytes"] -= len(responses.popitem(last=False)[1][2])
+                stats["evictions"] += 1
+        return result
+
+    return wrapper
+
+
+def cache_info():
+    with lock:
+        return {
+            **stats,
+            "size": len(responses),
+            "budget_bytes": BUDGET_BYTES,
+            "pages": sorted({module for module, _, _ in responses}),
+        }
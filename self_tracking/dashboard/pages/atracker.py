@@ -5,6 +5,7 @@ from dash import Input, Output, clientside_callback, dcc, html
 import plotly.express as px
 import plotly.graph_objects as go
 from self_tracking.dashboard.components.controls import Select, Checkbox
+from self_tracking.dashboard.figure_cache import cached
 import self_tracking.data as d
 import dash_mantine_components as dmc
 import pandas as pd
@@ -54,22 +55,6 @@ layout = html.Div(
 )
 
 
-last_mtime = 0.0
-last_df: pd.DataFrame | None = None
-
-
-def get_df() -> pd.DataFrame:
-    global last_mtime
-    global last_df
-    mtime = d.atracker_mtime()
-    if last_df is not None and mtime == last_mtime:
-        return last_df
-    df = d.atracker(use_names=True)
-    last_df = df
-    last_mtime = mtime
-    return df
-
-
 clientside_callback(
     """
     function updateLoadingState(n_clicks) {
@@ -246,12 +231,13 @@ def create_calendar_chart():
         Input("atracker-refresh-counter", "data"),
     ],
 )
+@cached
 def update_graph(rule: str, agg: str, limit: bool, omit_last: bool, _n_clicks: int):
     if rule == "calendar":
         fig = create_calendar_chart()
         return dcc.Graph(figure=fig)
 
-    df = get_df()
+    df = d.atracker(use_names=True)
 
     if omit_last:
         df = df.iloc[:-1]
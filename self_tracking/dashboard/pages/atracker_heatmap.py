@@ -5,6 +5,7 @@ from dash import Input, Output, dcc, html
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 from self_tracking.dashboard.components.controls import Select
+from self_tracking.dashboard.figure_cache import cached
 import self_tracking.data as d
 import dash_mantine_components as dmc
 
@@ -42,6 +43,7 @@ layout = html.Div(
     Output("heatmap-chart", "children"),
     Input("heatmap-start-date", "value"),
 )
+@cached
 def update_graph(start_date: str):
     hm = d.atracker_heatmap(start_date)
     hm.columns = d.atracker_categories().name[hm.columns].values
@@ -2,12 +2,11 @@ import dash
 from dash import Input, Output, dcc, html
 import plotly.graph_objects as go
 from self_tracking.dashboard.components.controls import Select
+from self_tracking.dashboard.figure_cache import cached
 import self_tracking.data as d
 import dash_mantine_components as dmc
 import pandas as pd
-import numpy as np
 from plotly.subplots import make_subplots
-import statsmodels.api as sm
 
 dash.register_page(__name__)
 
@@ -56,6 +55,7 @@ layout = html.Div(
         Input("calories-agg", "value"),
     ],
 )
+@cached
 def update_graph(rule: str, agg: str):
     eaten = d.diet().calories
     start = eaten.index.min()
@@ -64,15 +64,7 @@ def update_graph(rule: str, agg: str):
     active = d.activity().active_calories[start:end]
 
     weight_raw = d.weight().weight[start:end]
-
-    lowess_result = sm.nonparametric.lowess(
-        weight_raw, weight_raw.index.astype(np.int64), frac=0.03
-    )
-    weight = (
-        pd.Series(data=lowess_result[:, 1], index=pd.to_datetime(lowess_result[:, 0]))
-        .reindex(pd.date_range(start, end))
-        .interpolate(method="time")
-    )
+    weight = d.smoothed_weight()
 
     basal = weight * 12.5  # Approximation from previous analysis
 
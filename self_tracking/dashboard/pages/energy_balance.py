@@ -1,13 +1,11 @@
 import dash
-from dash import Input, Output, dcc, html
+from dash import Input, Output, State, clientside_callback, dcc, html
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 from self_tracking.dashboard.components.controls import Select
 import self_tracking.data as d
 import dash_mantine_components as dmc
 import pandas as pd
-import numpy as np
-import statsmodels.api as sm
 
 dash.register_page(__name__, title="Energy Balance")
 
@@ -57,6 +55,8 @@ layout = html.Div(
                     tooltip={"placement": "bottom", "always_visible": False},
                     persistence_type="local",
                     persistence=True,
+                    # Cheap to follow while dragging now it's redrawn clientside.
+                    updatemode="drag",
                 ),
             ],
             gap="xs",
@@ -65,6 +65,7 @@ layout = html.Div(
             mt="md",
         ),
         dcc.Graph(id="eb-graph", style={"height": "720px"}),
+        dcc.Store(id="eb-terms"),
     ]
 )
 
@@ -76,15 +77,7 @@ def base_frame() -> pd.DataFrame:
 
     active = d.activity().active_calories[start:end]
     weight_raw = d.weight().weight[start:end].dropna()
-
-    lowess_result = sm.nonparametric.lowess(
-        weight_raw, weight_raw.index.astype(np.int64), frac=0.03
-    )
-    weight = (
-        pd.Series(data=lowess_result[:, 1], index=pd.to_datetime(lowess_result[:, 0]))
-        .reindex(pd.date_range(start, end))
-        .interpolate(method="time")
-    )
+    weight = d.smoothed_weight()
 
     df = pd.DataFrame(
         {
@@ -127,60 +120,125 @@ def visible_window(relayout: dict | None, df: pd.DataFrame) -> tuple:
     return default_start, full_end
 
 
-def reconcile(df: pd.DataFrame, start, end) -> tuple:
-    """Best-fit basal multiplier and mean intake−scale gap over [start, end].
+def reconcile_terms(df: pd.DataFrame, start, end) -> dict | None:
+    """The basal-independent parts of the best-fit multiplier and mean
+    intake−scale gap over [start, end].
 
-    Solves  sum(eaten - active) - k*sum(weight) = (w_end - w_start) * CAL_PER_LB.
+    Solves  sum(eaten - active) - k*sum(weight) = (w_end - w_start) * CAL_PER_LB,
+    and the gap is  mean(eaten - active) - k*mean(weight) - scale/days.
     """
-    window = df.loc[start:end].dropna(subset=["eaten", "active", "weight", "balance"])
+    window = df.loc[start:end].dropna(subset=["eaten", "active", "weight"])
     if len(window) < 14 or window.weight.sum() == 0:
-        return None, None
+        return None
     scale = (window.weight.iloc[-1] - window.weight.iloc[0]) * CAL_PER_LB
-    fitted = ((window.eaten - window.active).sum() - scale) / window.weight.sum()
-    gap = window.balance.mean() - scale / len(window)
-    return fitted, gap
+    net = window.eaten - window.active
+    return {
+        "fitted": float((net.sum() - scale) / window.weight.sum()),
+        "net": float(net.mean()),
+        "weight": float(window.weight.mean()),
+        "scale": float(scale / len(window)),
+    }
+
+
+def bar_terms(df: pd.DataFrame, rule: str) -> pd.DataFrame:
+    """Daily averages per period, split so basal and balance are linear in k.
+
+    Basal averages every day with a weight; balance only the days with all of
+    eaten, active and weight, so its two parts are averaged over those alone.
+    """
+    valid = df[["eaten", "active", "weight"]].notna().all(axis=1)
+    terms = pd.DataFrame(
+        {
+            "eaten": df.eaten,
+            "active": df.active,
+            "weight": df.weight,
+            "net": (df.eaten - df.active).where(valid),
+            "net_weight": df.weight.where(valid),
+        }
+    )
+    bars = terms.resample(rule, closed="left", label="left").mean()
+    bars.index = bars.index + period_offsets[rule]
+    return bars
+
+
+def prediction_terms(df: pd.DataFrame, view_start) -> pd.DataFrame:
+    """Running sums for the predicted weight, which is
+    anchor + (net - k*weight) / CAL_PER_LB.
+
+    Re-anchored to actual weight at the visible start so it never accumulates
+    error from outside the window on screen.
+    """
+    pred = df.loc[df.index >= view_start].dropna(subset=["eaten", "active", "weight"])
+    anchor = df.weight.asof(view_start)
+    if pd.isna(anchor) and not pred.empty:
+        anchor = pred.weight.iloc[0]
+    return pd.DataFrame(
+        {
+            "anchor": anchor,
+            "net": (pred.eaten - pred.active).cumsum(),
+            "weight": pred.weight.cumsum(),
+        },
+        index=pred.index,
+    )
+
+
+def format_readout(k: float, last_weight: float, reconcile: dict | None) -> str:
+    # Mirrored by the clientside callback below, keep the two in step.
+    fitted = reconcile["fitted"] if reconcile else None
+    fitted_txt = f"window reconciles at ×{fitted:.1f}" if fitted else "window too short to fit"
+    readout = (
+        f"×{k:.1f}  ({last_weight * k:,.0f} Cal/day @ "
+        f"{last_weight:.0f} lb)  ·  {fitted_txt}"
+    )
+    if reconcile:
+        gap = reconcile["net"] - k * reconcile["weight"] - reconcile["scale"]
+        readout += f"  ·  intake−scale gap {gap:+.0f} Cal/day"
+    return readout
+
+
+def to_list(values: pd.Series) -> list:
+    return [None if pd.isna(v) else float(v) for v in values]
 
 
 @dash.callback(
     Output("eb-graph", "figure"),
     Output("eb-readout", "children"),
+    Output("eb-terms", "data"),
     Input("eb-period", "value"),
-    Input("eb-basal-k", "value"),
     Input("eb-graph", "relayoutData"),
+    State("eb-basal-k", "value"),
 )
-def update_graph(rule: str, k: float, relayout: dict | None):
+def update_graph(rule: str, relayout: dict | None, k: float):
     df = base_frame()
-
-    df["basal"] = df.weight * k
-    df["balance"] = df.eaten - df.active - df.basal
-
     view_start, view_end = visible_window(relayout, df)
 
-    # --- Predicted weight (row 2): re-anchored to actual weight at the visible
-    # start so it never accumulates error from outside the window on screen. ---
-    anchor = df.weight.asof(view_start)
-    pred = df.loc[df.index >= view_start].dropna(subset=["balance"]).copy()
-    if pd.isna(anchor) and not pred.empty:
-        anchor = pred.weight.iloc[0]
-    pred["weight_pred"] = anchor + (pred.balance / CAL_PER_LB).cumsum()
-
-    # --- Bars aggregated to the chosen period as daily averages (row 1). ---
-    bars = df[["eaten", "active", "basal", "balance"]].resample(
-        rule, closed="left", label="left"
-    ).mean()
-    bars.index = bars.index + period_offsets[rule]
+    # Everything here is independent of k, and goes to the browser so the basal
+    # slider can be applied there without a round trip.
+    bars = bar_terms(df, rule)
+    pred = prediction_terms(df, view_start)
+    terms = {
+        "weight": to_list(bars.weight),
+        "net": to_list(bars.net),
+        "net_weight": to_list(bars.net_weight),
+        "anchor": to_list(pred.anchor.iloc[:1])[0] if not pred.empty else None,
+        "pred_net": to_list(pred.net),
+        "pred_weight": to_list(pred.weight),
+        "last_weight": df.weight.iloc[-1],
+        "reconcile": reconcile_terms(df, view_start, view_end),
+    }
 
     fig = make_subplots(
         rows=2, cols=1, shared_xaxes=True, row_heights=[0.55, 0.45], vertical_spacing=0.06
     )
 
-    # Row 1: eaten up, basal + active stacked down, net balance as a line.
+    # Row 1: eaten up, basal + active stacked down, net balance as a line. The
+    # clientside callback redraws Basal, Net balance and Predicted by position.
     fig.add_trace(
         go.Bar(x=bars.index, y=bars.eaten, name="Eaten", marker_color="#4c9f70"),
         row=1, col=1,
     )
     fig.add_trace(
-        go.Bar(x=bars.index, y=-bars.basal, name="Basal", marker_color="#b9c4cc"),
+        go.Bar(x=bars.index, y=-k * bars.weight, name="Basal", marker_color="#b9c4cc"),
         row=1, col=1,
     )
     fig.add_trace(
@@ -190,7 +248,7 @@ def update_graph(rule: str, k: float, relayout: dict | None):
     fig.add_trace(
         go.Scatter(
             x=bars.index,
-            y=bars.balance,
+            y=bars.net - k * bars.net_weight,
             name="Net balance",
             mode="lines+markers",
             line=dict(color="#d1495b", width=2),
@@ -217,7 +275,8 @@ def update_graph(rule: str, k: float, relayout: dict | None):
     )
     fig.add_trace(
         go.Scatter(
-            x=pred.index, y=pred.weight_pred, name="Predicted",
+            x=pred.index, y=pred.anchor + (pred.net - k * pred.weight) / CAL_PER_LB,
+            name="Predicted",
             mode="lines", line=dict(color="#d1495b", width=2, dash="dot"),
             fill="tonexty", fillcolor="rgba(209,73,91,0.12)",
         ),
@@ -258,14 +317,60 @@ def update_graph(rule: str, k: float, relayout: dict | None):
     fig.update_xaxes(range=[default_start, df.index.max() + right_pad])
     fig.add_hline(y=0, line_width=1, line_color="grey", row=1, col=1)
 
-    # --- Readout, computed over the visible window. ---
-    fitted, gap = reconcile(df, view_start, view_end)
-    fitted_txt = f"window reconciles at ×{fitted:.1f}" if fitted else "window too short to fit"
-    gap_txt = f"intake−scale gap {gap:+.0f} Cal/day" if gap is not None else ""
-    readout = (
-        f"×{k:.1f}  ({df.weight.iloc[-1] * k:,.0f} Cal/day @ "
-        f"{df.weight.iloc[-1]:.0f} lb)  ·  {fitted_txt}"
-        + (f"  ·  {gap_txt}" if gap_txt else "")
-    )
+    readout = format_readout(k, terms["last_weight"], terms["reconcile"])
+
+    # NaN isn't valid JSON, so the browser gets null instead.
+    if pd.isna(terms["last_weight"]):
+        terms["last_weight"] = None
+
+    return fig, readout, terms
+
+
+clientside_callback(
+    """
+    function applyBasal(k, terms, figure) {
+        const noUpdate = window.dash_clientside.no_update;
+        if (!terms || !figure) {
+            return [noUpdate, noUpdate];
+        }
+
+        // a - k * b, leaving a gap wherever either is missing.
+        const less = (a, b) =>
+            a.map((v, i) => (v === null || b[i] === null ? null : v - k * b[i]));
+
+        const data = [...figure.data];
+        data[1] = {...data[1], y: terms.weight.map((w) => (w === null ? null : -k * w))};
+        data[3] = {...data[3], y: less(terms.net, terms.net_weight)};
+        data[6] = {
+            ...data[6],
+            y: less(terms.pred_net, terms.pred_weight).map((v) =>
+                v === null || terms.anchor === null ? null : terms.anchor + v / CAL_PER_LB
+            ),
+        };
+
+        // Same text as format_readout.
+        const last = terms.last_weight;
+        const r = terms.reconcile;
+        const cal = last === null
+            ? "nan"
+            : (last * k).toLocaleString("en-US", {maximumFractionDigits: 0});
+        const lb = last === null ? "nan" : last.toFixed(0);
+        let readout =
+            `×${k.toFixed(1)}  (${cal} Cal/day @ ${lb} lb)  ·  ` +
+            (r && r.fitted ? `window reconciles at ×${r.fitted.toFixed(1)}` : "window too short to fit");
+        if (r) {
+            const gap = r.net - k * r.weight - r.scale;
+            const sign = gap < 0 ? "-" : "+";
+            readout += `  ·  intake−scale gap ${sign}${Math.abs(gap).toFixed(0)} Cal/day`;
+        }
 
-    return fig, readout
+        return [{...figure, data: data}, readout];
+    }
+    """.replace("CAL_PER_LB", str(CAL_PER_LB)),
+    Output("eb-graph", "figure", allow_duplicate=True),
+    Output("eb-readout", "children", allow_duplicate=True),
+    Input("eb-basal-k", "value"),
+    State("eb-terms", "data"),
+    State("eb-graph", "figure"),
+    prevent_initial_call=True,
+)
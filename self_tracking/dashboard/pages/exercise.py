@@ -3,6 +3,7 @@ import dash
 from dash import Input, Output, dcc, html
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
+from self_tracking.dashboard.figure_cache import cached
 import self_tracking.data as d
 import dash_mantine_components as dmc
 import pandas as pd
@@ -42,6 +43,7 @@ layout = html.Div(
     Output("exercise-chart", "children"),
     [Input("exercise-period", "value")],
 )
+@cached
 def update_graph(rule: str):
     fig = make_subplots(
         rows=4,
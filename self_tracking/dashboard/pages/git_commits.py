@@ -2,6 +2,7 @@ import dash
 from dash import dcc, html
 import plotly.express as px
 import plotly.graph_objects as go
+from self_tracking.dashboard.figure_cache import cached
 import self_tracking.data as d
 
 dash.register_page(__name__, title="Git Commits")
@@ -14,6 +15,7 @@ layout = html.Div(id="git-commits-chart")
     dash.Output("git-commits-chart", "children"),
     dash.Input("git-commits-chart", "id"),
 )
+@cached
 def update_graph(_):
     df = d.git_commits()
 
@@ -6,12 +6,12 @@ import dash_mantine_components as dmc
 import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
-import statsmodels.api as sm
 from dash import Input, Output, dcc, html
 from plotly.subplots import make_subplots
 
 import self_tracking.data as d
 from self_tracking.dashboard.components.controls import Select
+from self_tracking.intervals import Intervals
 
 dash.register_page(__name__, path="/", title="Home")
 
@@ -138,20 +138,18 @@ def intervals(start, duration) -> pd.DataFrame:
     return pd.DataFrame({"start": start, "end": end})
 
 
-def overlap_hours(events: pd.DataFrame, lo, hi) -> np.ndarray:
+def timeline(events: pd.DataFrame) -> Intervals:
+    """Events sorted once for measuring against many windows."""
+    return Intervals.of(to_hours(events.start), to_hours(events.end))
+
+
+def overlap_hours(events: Intervals, lo, hi) -> np.ndarray:
     """Event hours falling inside each [lo[i], hi[i]) window.
 
     `lo` may hold a single value to measure every window from a common origin,
     which is how the within-week running total is built.
     """
-    lo_hours, hi_hours = to_hours(lo), to_hours(hi)
-    if events.empty:
-        return np.zeros(len(hi_hours))
-    starts, ends = to_hours(events.start), to_hours(events.end)
-    inside = np.minimum(ends[None, :], hi_hours[:, None]) - np.maximum(
-        starts[None, :], lo_hours[:, None]
-    )
-    return np.clip(inside, 0, None).sum(axis=1)
+    return events.overlap(to_hours(lo), to_hours(hi))
 
 
 def event_series(start_date: pd.Timestamp) -> dict[str, dict[str, pd.DataFrame]]:
@@ -182,19 +180,9 @@ def energy_balance() -> pd.Series:
     start, end = eaten.index.min(), eaten.index.max()
 
     active = d.activity().active_calories[start:end]
-    weight_raw = d.weight().weight[start:end].dropna()
-
-    lowess_result = sm.nonparametric.lowess(
-        weight_raw, weight_raw.index.astype(np.int64), frac=0.03
-    )
-    weight = (
-        pd.Series(data=lowess_result[:, 1], index=pd.to_datetime(lowess_result[:, 0]))
-        .reindex(pd.date_range(start, end))
-        .interpolate(method="time")
-        # Carry the last smoothed weight forward so a few days without a
-        # weigh-in don't blank out the most recent bars.
-        .ffill()
-    )
+    # Carry the last smoothed weight forward so a few days without a weigh-in
+    # don't blank out the most recent bars.
+    weight = d.smoothed_weight().ffill()
 
     return (eaten - active - weight * BASAL_MULTIPLIER).round().rename_axis("date")
 
@@ -234,6 +222,8 @@ def add_burn_up(
 ):
     """One line per week, climbing in real time and stacked where a chart has
     more than one series."""
+    timelines = {name: timeline(events) for name, events in series.items()}
+
     for start in weeks:
         limit = min(start + WEEK, now)
         if limit <= start:
@@ -244,7 +234,7 @@ def add_burn_up(
         stacked = np.zeros(len(grid))
 
         for depth, (name, color) in enumerate(chart.colors.items()):
-            own = overlap_hours(series[name], origin, grid)
+            own = overlap_hours(timelines[name], origin, grid)
             stacked = stacked + own
             fig.add_trace(
                 go.Scatter(
@@ -326,7 +316,7 @@ def update_graph(mode: str):
             add_burn_up(fig, row, chart, series[chart.key], weeks, now)
         elif chart.timed:
             totals = {
-                name: overlap_hours(events, weeks, weeks + WEEK)
+                name: overlap_hours(timeline(events), weeks, weeks + WEEK)
                 for name, events in series[chart.key].items()
             }
             for name, color in chart.colors.items():
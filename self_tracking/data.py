@@ -1,8 +1,32 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import hashlib
+import json
 import subprocess
-from datetime import datetime, timedelta
-from typing import Any, cast
+import threading
+from datetime import date, datetime, timedelta
+from functools import cache, wraps
+from pathlib import Path
+from typing import Any, Callable, cast
+import numpy as np
 import pandas as pd
-from self_tracking.dirs import diary_dir, projects_dir
+import statsmodels.api as sm
+from self_tracking.atomic import atomic_path, write_atomic
+from self_tracking.dirs import cache_dir, diary_dir, projects_dir
+
+sidecar_dir = cache_dir / "self-tracking-tsv"
+git_index_path = cache_dir / "git-commits.json"
+
+# Most memoized results kept in memory, least recently used dropped first.
+MEMO_SIZE = 128
+
+# Share of the weigh-ins in each point's neighbourhood when smoothing weight.
+WEIGHT_FRAC = 0.03
+ROBUST_ITERATIONS = 3
+
+# Repos whose git log runs at once.
+GIT_WORKERS = 8
 
 
 # %%
@@ -10,19 +34,163 @@ def filepath(name: str):
     return diary_dir / f"data/{name}.tsv"
 
 
+memo: OrderedDict[tuple, tuple[set[Path], tuple, Any]] = OrderedDict()
+memo_stats = {"hits": 0, "misses": 0}
+memo_lock = threading.Lock()
+# One per memo key, held while its result is worked out.
+memo_key_locks: dict[tuple, threading.Lock] = {}
+# Per thread, the files read by each memoized call that is still running.
+reading = threading.local()
+
+
+def track(path: Path):
+    """Note that every memoized call in progress depends on `path`."""
+    for files in getattr(reading, "stack", []):
+        files.add(path)
+
+
+def files_version(files: set[Path]) -> tuple:
+    def stat(path: Path):
+        # A directory's mtime changes when files are added or removed.
+        if not path.exists():
+            return None
+        st = path.stat()
+        return (st.st_mtime_ns, st.st_size)
+
+    # Some accessors fill open-ended ranges up to today, so the date counts too.
+    return (date.today(), *sorted((str(p), stat(p)) for p in files))
+
+
+@contextmanager
+def tracking():
+    """Collect the files read inside the block, directly or through accessors."""
+    stack = reading.__dict__.setdefault("stack", [])
+    files: set[Path] = set()
+    stack.append(files)
+    try:
+        yield files
+    finally:
+        stack.pop()
+
+
+def memoize(func):
+    """Keep an accessor's result until a file it read, directly or through
+    other accessors, changes.
+
+    Dependencies are found by tracking reads while the accessor runs, so they
+    never need declaring. Callers get a copy since most go on to modify it.
+
+    Threads asking for the same result at once wait for the first one to work
+    it out rather than each reading and caching the same files.
+    """
+
+    def lookup(key: tuple):
+        with memo_lock:
+            found = memo.get(key)
+        if found and found[1] == files_version(found[0]):
+            with memo_lock:
+                # Another thread may have evicted it since.
+                if key in memo:
+                    memo.move_to_end(key)
+                memo_stats["hits"] += 1
+            return found
+        return None
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        key = (func.__name__, args, tuple(sorted(kwargs.items())))
+
+        found = lookup(key)
+        if not found:
+            with memo_lock:
+                key_lock = memo_key_locks.setdefault(key, threading.Lock())
+            with key_lock:
+                found = lookup(key)
+                if not found:
+                    with tracking() as files:
+                        result = func(*args, **kwargs)
+                    found = (files, files_version(files), result)
+                    with memo_lock:
+                        memo[key] = found
+                        memo_stats["misses"] += 1
+                        while len(memo) > MEMO_SIZE:
+                            memo.popitem(last=False)
+
+        files, _, result = found
+        for path in files:
+            track(path)
+        return result.copy()
+
+    return wrapper
+
+
+def memo_info():
+    with memo_lock:
+        return {**memo_stats, "size": len(memo), "max_size": MEMO_SIZE}
+
+
+def sidecar(parse: Callable[..., pd.DataFrame]):
+    """Cache what `parse(file, **kwargs)` returns in a pickle beside a copy of
+    the TSV's path, keyed by its mtime and size.
+
+    The TSV stays the source of truth: any change to it is a miss, which parses
+    it again and replaces the stale pickle.
+    """
+
+    @wraps(parse)
+    def wrapper(file: Path, **kwargs) -> pd.DataFrame:
+        track(file)
+        stat = file.stat()
+        variant = f"{parse.__name__}{sorted(kwargs.items())}"
+        prefix = f"{file.stem}.{hashlib.md5(variant.encode()).hexdigest()[:8]}"
+        cache_file = (
+            sidecar_dir
+            / file.parent.relative_to(diary_dir)
+            / f"{prefix}.{stat.st_mtime_ns}-{stat.st_size}.pkl"
+        )
+        try:
+            return pd.read_pickle(cache_file)
+        except FileNotFoundError:
+            # Not cached yet, or swept away as stale by another thread.
+            pass
+
+        df = parse(file, **kwargs)
+        with atomic_path(cache_file) as tmp_file:
+            df.to_pickle(tmp_file)
+        # Another thread may be clearing out the same stale pickles.
+        for stale_file in cache_file.parent.glob(f"{prefix}.*.pkl"):
+            if stale_file != cache_file:
+                stale_file.unlink(missing_ok=True)
+        return df
+
+    return wrapper
+
+
+@sidecar
+def read_tsv(file: Path, **kwargs) -> pd.DataFrame:
+    return pd.read_table(file, **kwargs)
+
+
+@sidecar
+def read_events_tsv(file: Path) -> pd.DataFrame:
+    df = pd.read_table(file)
+    df["start"] = pd.to_datetime(df.start, utc=True).dt.tz_convert("Europe/London")
+    return df
+
+
 def read_date_indexed(name: str):
-    return pd.read_table(filepath(name), parse_dates=["date"], index_col="date")
+    return read_tsv(filepath(name), parse_dates=["date"], index_col="date")
 
 
 def read_events(name: str, index_col: str | None = "start"):
-    df = pd.read_table(filepath(name))
-    df["start"] = pd.to_datetime(df.start, utc=True).dt.tz_convert("Europe/London")
+    df = read_events_tsv(filepath(name))
     if index_col:
         df = df.set_index(index_col)
     return df
 
 
 # %%
+@memoize
 def atracker_events(start_date: str | None = None):
     df = (
         pd.concat(
@@ -44,23 +212,12 @@ def atracker_events(start_date: str | None = None):
     return df
 
 
-def atracker_mtime():
-    names = [
-        "atracker",
-        "meditation",
-        "workouts/climbing",
-        "workouts/cycling-indoor",
-        "workouts/cycling",
-        "workouts/running",
-        "workouts/strength",
-    ]
-    return max(filepath(name).stat().st_mtime for name in names)
-
-
+@memoize
 def atracker_categories():
-    return pd.read_table(filepath("atracker-categories"), index_col="category")
+    return read_tsv(filepath("atracker-categories"), index_col="category")
 
 
+@memoize
 def atracker_color_map(use_names=False) -> dict[str, str]:
     categories = atracker_categories()
     if use_names:
@@ -68,6 +225,7 @@ def atracker_color_map(use_names=False) -> dict[str, str]:
     return categories.color.to_dict()
 
 
+@memoize
 def atracker(start_date: str | None = "2020-05-04", use_names=False):
     df = atracker_events(start_date).pivot_table(
         values="duration", index="date", columns="category", aggfunc="sum"
@@ -86,40 +244,130 @@ def atracker(start_date: str | None = "2020-05-04", use_names=False):
     return df
 
 
-def atracker_heatmap(start_date="2020-05-04"):
-    categories = list(atracker_categories().index)
+def heatmap_marks(events: pd.DataFrame, categories: list[str]) -> pd.DataFrame:
+    """Difference array entries for each event's minutes of the day, over a
+    two day span that gets folded back at midnight.
+
+    Whole days cover every minute once each, so only the remainder needs
+    marking out between a +1 and a -1.
+    """
     minutes_in_day = 24 * 60
-    heatmap = pd.DataFrame(0, index=range(minutes_in_day), columns=categories)
 
-    events = atracker_events(start_date)
+    column = pd.Categorical(events.category, categories=categories).codes
+    start = (events.start.dt.hour * 60 + events.start.dt.minute).to_numpy()
+    length = np.round(events.duration.to_numpy() * 60).astype(int).clip(0)
+    days, rest = np.divmod(length, minutes_in_day)
+    known = column >= 0
+    long = known & (days > 0)
+
+    def marks(mask, minute, delta):
+        return pd.DataFrame(
+            {
+                "date": events.date.to_numpy()[mask],
+                "minute": np.broadcast_to(minute, len(events))[mask],
+                "column": column[mask].astype(np.int64),
+                "delta": np.broadcast_to(delta, len(events))[mask],
+            }
+        )
+
+    return (
+        pd.concat(
+            [
+                marks(known, start, 1),
+                marks(known, start + rest, -1),
+                marks(long, 0, days),
+                marks(long, minutes_in_day, -days),
+            ]
+        )
+        .sort_values("date", kind="stable")
+        .reset_index(drop=True)
+    )
+
+
+def heatmap_store(categories: list[str]) -> pd.DataFrame:
+    """Heatmap marks for every day, sorted by date.
+
+    Kept on disk with a hash of each day's events so only days whose events
+    changed are marked out again.
+    """
+    path = sidecar_dir / "atracker-heatmap.pkl"
+    events = atracker_events()
+    hashes = (
+        pd.util.hash_pandas_object(
+            events[["start", "duration", "category"]], index=False
+        )
+        .groupby(events.date.to_numpy())
+        .sum()
+    )
+
+    stored = pd.read_pickle(path) if path.exists() else None
+    if stored is None or stored["categories"] != categories:
+        marks = heatmap_marks(events, categories)
+    else:
+        old = stored["hashes"]
+        common = hashes.index.intersection(old.index)
+        same = common[hashes[common].to_numpy() == old[common].to_numpy()]
+        if len(same) == len(hashes) == len(old):
+            return stored["marks"]
+        kept = stored["marks"].loc[lambda df: df.date.isin(same)]
+        fresh = heatmap_marks(events.loc[~events.date.isin(same)], categories)
+        marks = (
+            pd.concat([kept, fresh])
+            .sort_values("date", kind="stable")
+            .reset_index(drop=True)
+        )
+
+    store = {"categories": categories, "hashes": hashes, "marks": marks}
+    with atomic_path(path) as tmp_path:
+        pd.to_pickle(store, tmp_path)
+    return marks
 
-    for event in events.itertuples(index=False):
-        event: Any = event
-        start_minute = event.start.hour * 60 + event.start.minute
-        num_minutes = round(event.duration * 60)
-        for minute in range(start_minute, start_minute + num_minutes):
-            heatmap.loc[minute % minutes_in_day, event.category] += cast(Any, 1)
 
-    return heatmap
+def heatmap_counts(marks: pd.DataFrame, categories: list[str]) -> pd.DataFrame:
+    minutes_in_day = 24 * 60
+    diff = np.zeros((2 * minutes_in_day + 1, len(categories)), dtype=np.int64)
+    np.add.at(
+        diff,
+        (marks.minute.to_numpy(), marks.column.to_numpy()),
+        marks.delta.to_numpy(),
+    )
+    counts = diff.cumsum(axis=0)
+    counts = counts[:minutes_in_day] + counts[minutes_in_day:-1]
+    return pd.DataFrame(counts, index=range(minutes_in_day), columns=categories)
+
+
+@memoize
+def atracker_heatmap(start_date="2020-05-04"):
+    """Number of events covering each minute of the day, per category."""
+    categories = list(atracker_categories().index)
+    marks = heatmap_store(categories)
+    if start_date:
+        marks = marks.iloc[marks.date.searchsorted(pd.Timestamp(start_date)) :]
+    return heatmap_counts(marks, categories)
 
 
 # %%
+@memoize
 def climbing():
     return read_events("workouts/climbing")
 
 
+@memoize
 def cycling_indoor():
     return read_events("workouts/cycling-indoor")
 
 
+@memoize
 def cycling():
     return read_events("workouts/cycling")
 
 
+@memoize
 def running():
     return read_events("workouts/running")
 
 
+@memoize
 def strength():
     programs = list(strength_programs()[::-1].itertuples())
     df = read_events("workouts/strength")
@@ -130,6 +378,7 @@ def strength():
     return df[["duration", "program"]]
 
 
+@memoize
 def strength_exercises():
     df = read_events("strength-exercises", index_col=None)
     df["reps"] = df.reps.astype("Int64")
@@ -137,14 +386,16 @@ def strength_exercises():
     return df
 
 
+@memoize
 def strength_programs():
-    df = pd.read_table(filepath("strength-programs"), parse_dates=["start"])
+    df = read_tsv(filepath("strength-programs"), parse_dates=["start"])
     df["end"] = df.start.shift(-1) - pd.to_timedelta(1, unit="D")
     df["end"] = df.end.fillna(pd.to_datetime(datetime.now().date()))
     df["duration"] = df.end - df.start + pd.to_timedelta(1, unit="D")
     return df[["start", "end", "duration", "name"]]
 
 
+@memoize
 def workouts():
     events = [
         climbing().assign(type="climbing"),
@@ -158,49 +409,100 @@ def workouts():
 
 
 # %%
+@memoize
 def activity():
     return read_date_indexed("activity")
 
 
+@memoize
 def diet():
     return read_date_indexed("diet")
 
 
+@memoize
 def sleep():
     df = read_date_indexed("sleep")
     df["Asleep"] = df.Deep + df.Core + df.REM
     return df
 
 
+@memoize
 def weight():
     return read_date_indexed("weight")
 
 
+def lowess_fit(raw: pd.Series) -> np.ndarray:
+    """LOWESS of the weigh-ins, kept on disk with the weigh-ins it came from so
+    a fresh process doesn't fit the same ones again.
+
+    Any change, even a weigh-in appended at the end, fits everything again. The
+    robustness iterations scale residuals by their median over every weigh-in,
+    so a new one nudges the fit all the way back and only a full fit is exact.
+    """
+    path = sidecar_dir / "weight-lowess.pkl"
+
+    old = pd.read_pickle(path) if path.exists() else None
+    if old is not None and old["raw"].equals(raw):
+        return old["fit"]
+
+    fit = sm.nonparametric.lowess(
+        raw.to_numpy(dtype=float),
+        raw.index.to_numpy().astype(np.int64),
+        frac=WEIGHT_FRAC,
+        it=ROBUST_ITERATIONS,
+        return_sorted=False,
+    )
+
+    with atomic_path(path) as tmp_path:
+        pd.to_pickle({"raw": raw, "fit": fit}, tmp_path)
+    return fit
+
+
+@memoize
+def smoothed_weight():
+    """Weight for each day of the diet log, LOWESS smoothed and interpolated
+    between weigh-ins."""
+    eaten = diet().calories
+    start, end = eaten.index.min(), eaten.index.max()
+    raw = weight().weight[start:end].dropna()
+
+    return (
+        pd.Series(lowess_fit(raw), index=raw.index)
+        .reindex(pd.date_range(start, end))
+        .interpolate(method="time")
+    )
+
+
 # %%
+@memoize
 def eras():
-    df = pd.read_table(filepath("eras"), parse_dates=["start"])
+    df = read_tsv(filepath("eras"), parse_dates=["start"])
     df["end"] = df.start.shift(-1) - pd.to_timedelta(1, unit="D")
     df["end"] = df.end.fillna(pd.to_datetime(datetime.now().date()))
     df["duration"] = df.end - df.start + pd.to_timedelta(1, unit="D")
     return df[["start", "end", "duration", "name", "color"]]
 
 
+@memoize
 def holidays():
-    df = pd.read_table(filepath("holidays"), parse_dates=["start", "end"])
+    df = read_tsv(filepath("holidays"), parse_dates=["start", "end"])
     df["duration"] = df.end - df.start + timedelta(days=1)
     return df[["start", "end", "duration", "name"]]
 
 
+@memoize
 def streaks():
-    return pd.read_table(filepath("streaks"), parse_dates=["date"])
+    return read_tsv(filepath("streaks"), parse_dates=["date"])
 
 
 # %%
+@memoize
 def money():
     money_dir = diary_dir / "data/money"
+    track(money_dir)
     series = {}
     for f in sorted(money_dir.glob("*.tsv")):
-        df = pd.read_table(f, parse_dates=["date"]).set_index("date")
+        df = read_tsv(f, parse_dates=["date"]).set_index("date")
         series[f.stem] = df["balance"]
 
     if not series:
@@ -215,27 +517,97 @@ def money():
     return combined
 
 
-def git_commits():
-    my_name = subprocess.run(
+def git_head(repo: Path) -> str | None:
+    """The commit HEAD points at, read from the ref files without running git."""
+    try:
+        head = (repo / "HEAD").read_text().strip()
+        if not head.startswith("ref: "):
+            return head
+        ref = head.removeprefix("ref: ")
+        if (repo / ref).exists():
+            return (repo / ref).read_text().strip()
+        for line in (repo / "packed-refs").read_text().splitlines():
+            if line.endswith(f" {ref}"):
+                return line.split(" ", 1)[0]
+    except OSError:
+        pass
+    return None
+
+
+def git_log(repo: Path, author: str, *revisions: str) -> list[list[str]]:
+    result = subprocess.run(
+        [
+            "git",
+            f"--git-dir={repo}",
+            "log",
+            "--pretty=tformat:%aI%x00%s",
+            f"--author={author}",
+            *revisions,
+        ],
+        capture_output=True,
+        text=True,
+    )
+    return [line.split("\x00", 1) for line in result.stdout.splitlines()]
+
+
+def repo_commits(repo: Path, author: str, indexed: dict | None) -> dict:
+    """Commits in `repo` by `author`, only logging those past the indexed HEAD
+    when it's still in the history."""
+    head = git_head(repo)
+    if head is None:
+        return {"head": None, "rows": git_log(repo, author)}
+    if indexed and indexed["head"] == head:
+        return indexed
+
+    old = indexed and indexed["head"]
+    if old:
+        is_ancestor = subprocess.run(
+            ["git", f"--git-dir={repo}", "merge-base", "--is-ancestor", old, head],
+            capture_output=True,
+        )
+        if is_ancestor.returncode == 0:
+            new_rows = git_log(repo, author, f"{old}..{head}")
+            return {"head": head, "rows": new_rows + indexed["rows"]}
+
+    return {"head": head, "rows": git_log(repo, author, head)}
+
+
+@cache
+def git_author() -> str:
+    return subprocess.run(
         ["git", "config", "user.name"], check=True, capture_output=True, text=True
     ).stdout.strip()
 
-    rows = []
-    for repo in sorted(projects_dir.glob("*/.git")):
-        result = subprocess.run(
-            [
-                "git",
-                f"--git-dir={repo}",
-                "log",
-                "--pretty=tformat:%aI%x00%s",
-                f"--author={my_name}",
-            ],
-            capture_output=True,
-            text=True,
+
+def git_commits():
+    my_name = git_author()
+
+    index = json.loads(git_index_path.read_text()) if git_index_path.exists() else {}
+    indexed = index.get("repos", {}) if index.get("author") == my_name else {}
+
+    # New repos change the directory's mtime and new commits append to the
+    # HEAD reflog, which is enough for memoized figures to notice.
+    track(projects_dir)
+    paths = sorted(projects_dir.glob("*/.git"))
+    for repo in paths:
+        if (repo / "logs/HEAD").exists():
+            track(repo / "logs/HEAD")
+
+    # Mostly waiting on git, so threads are enough to overlap the repos.
+    with ThreadPoolExecutor(GIT_WORKERS) as pool:
+        found = pool.map(
+            lambda repo: repo_commits(repo, my_name, indexed.get(str(repo))), paths
         )
-        for line in result.stdout.splitlines():
-            dt, message = line.split("\x00", 1)
-            rows.append({"datetime": dt, "repo": repo.parent.name, "message": message})
+        repos = {str(repo): commits for repo, commits in zip(paths, found)}
+
+    if repos != indexed:
+        write_atomic(git_index_path, json.dumps({"author": my_name, "repos": repos}))
+
+    rows = [
+        {"datetime": dt, "repo": Path(repo).parent.name, "message": message}
+        for repo, commits in repos.items()
+        for dt, message in commits["rows"]
+    ]
 
     df = pd.DataFrame(rows)
     if df.empty:
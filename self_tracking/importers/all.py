@@ -1,3 +1,19 @@
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+import time
+from typing import Callable
+
+from rich.console import Console, Group
+from rich.live import Live
+from rich.spinner import Spinner
+from rich.table import Table
+from rich.text import Text
+
+from self_tracking.dirs import diary_dir, downloads_dir, icloud_dir
+
+from . import metrics, status
 from .apple_health import main as apple_health_main
 from .atracker import main as atracker_main
 from .incremental import main as incremental_main
@@ -6,15 +22,235 @@ from .routes import main as routes_main
 from .strong import main as strong_main
 from .workouts import main as workouts_main
 
+data_dir = diary_dir / "data"
+
+
+@dataclass(frozen=True)
+class Importer:
+    name: str
+    run: Callable[[], None]
+    # Files or whole directories read and written.
+    inputs: tuple[Path, ...] = ()
+    outputs: tuple[Path, ...] = ()
+
+
+# In the order they used to run in one after another, which is the order any
+# that touch the same files still run in.
+IMPORTERS = [
+    Importer(
+        "ATracker",
+        atracker_main,
+        outputs=(data_dir / "atracker.tsv",),
+    ),
+    Importer(
+        "Strong",
+        strong_main,
+        inputs=(downloads_dir / "strong_workouts.csv",),
+        outputs=(
+            data_dir / "exports/strong.csv",
+            data_dir / "workouts/strength.tsv",
+            data_dir / "strength-exercises.tsv",
+        ),
+    ),
+    Importer(
+        "Apple Health",
+        apple_health_main,
+        inputs=(
+            downloads_dir / "export.zip",
+            data_dir / "exports/running-manual.tsv",
+            data_dir / "exports/garmin.csv",
+            data_dir / "exports/weight-manual.tsv",
+        ),
+        outputs=(
+            data_dir / "apple-health-watermark.json",
+            data_dir / "workouts/running.tsv",
+            data_dir / "workouts/cycling-indoor.tsv",
+            data_dir / "workouts/cycling.tsv",
+            data_dir / "activity.tsv",
+            data_dir / "diet.tsv",
+            data_dir / "weight.tsv",
+            data_dir / "meditation.tsv",
+            data_dir / "sleep.tsv",
+        ),
+    ),
+    Importer(
+        "Apple Health incremental",
+        incremental_main,
+        inputs=(icloud_dir / "Health",),
+        outputs=(
+            data_dir / "activity.tsv",
+            data_dir / "diet.tsv",
+            data_dir / "weight.tsv",
+        ),
+    ),
+    Importer(
+        "Workouts",
+        workouts_main,
+        inputs=(icloud_dir / "Health/Workouts",),
+        outputs=(
+            data_dir / "workouts/cycling.tsv",
+            data_dir / "workouts/strength.tsv",
+            data_dir / "workouts/running.tsv",
+        ),
+    ),
+    Importer(
+        "GPX routes",
+        routes_main,
+        inputs=(icloud_dir / "Health/Routes",),
+        outputs=(data_dir / "routes",),
+    ),
+    Importer(
+        "Layers",
+        layers_main,
+        inputs=(data_dir, diary_dir / "entries"),
+        outputs=(diary_dir / "layers",),
+    ),
+]
+
+
+def overlaps(paths: tuple[Path, ...], others: tuple[Path, ...]):
+    return any(
+        path.is_relative_to(other) or other.is_relative_to(path)
+        for path in paths
+        for other in others
+    )
+
+
+def dependencies(importers: list[Importer]) -> dict[str, set[str]]:
+    """The earlier importers each one has to wait for: any that write what it
+    reads or writes, or read what it writes."""
+    return {
+        importer.name: {
+            earlier.name
+            for earlier in importers[:i]
+            if overlaps(earlier.outputs, importer.inputs + importer.outputs)
+            or overlaps(earlier.inputs, importer.outputs)
+        }
+        for i, importer in enumerate(importers)
+    }
+
+
+def render(lines: dict[str, status.Line], spinners: dict[str, Spinner]):
+    table = Table.grid(padding=(0, 1))
+    for name, line in lines.items():
+        if line.symbol is not None:
+            table.add_row(line.symbol, line.text)
+        elif name in spinners:
+            table.add_row(spinners[name], line.text)
+        else:
+            table.add_row(Text("·", style="dim"), Text(line.text, style="dim"))
+        for note in line.notes:
+            table.add_row("", Text(note, style="dim"))
+    return Group(table)
+
+
+def run(importer: Importer, line: status.Line):
+    status.current.line = line
+    try:
+        with metrics.stage(importer.name):
+            importer.run()
+    finally:
+        status.current.line = None
+
+
+def in_order(importers: list[Importer], records: list[metrics.Stage]):
+    """Each importer's stage in the order they're declared, followed by its
+    sub-steps in the order they finished, with how deep each one is."""
+    children: dict[str | None, list[metrics.Stage]] = {}
+    for record in records:
+        children.setdefault(record.parent, []).append(record)
+    order = [importer.name for importer in importers]
+    top = sorted(children.get(None, []), key=lambda record: order.index(record.name))
+
+    def visit(record: metrics.Stage, depth: int):
+        yield record, depth
+        for child in children.get(record.name, []):
+            yield from visit(child, depth + 1)
+
+    return [item for record in top for item in visit(record, 0)]
+
+
+def summary(stages: list[tuple[metrics.Stage, int]], wall: float):
+    def optional(rows: int | None):
+        return "" if rows is None else f"{rows:,}"
+
+    table = Table(title=f"Import took {wall:.1f}s", title_justify="left")
+    table.add_column("Stage")
+    for column in ["Wall", "CPU", "Peak RSS", "Rows in", "Rows out"]:
+        table.add_column(column, justify="right")
+    for record, depth in stages:
+        table.add_row(
+            "  " * depth + record.name,
+            f"{record.wall:.2f}s",
+            f"{record.cpu:.2f}s",
+            f"{record.peak_rss / 2**20:.0f} MB",
+            optional(record.rows_in),
+            optional(record.rows_out),
+            style="dim" if depth else None,
+        )
+    return table
+
+
+def main(importers: list[Importer] = IMPORTERS):
+    """Run the importers, each starting as soon as those it depends on have
+    finished, with a line each showing how they're getting on.
+
+    If one fails, the rest that don't depend on it still run and its error is
+    raised at the end.
+
+    Afterwards each importer's and sub-step's timings are shown in a table and
+    added to the history under the cache dir.
+    """
+    metrics.stages.clear()
+    started = datetime.now().isoformat(timespec="seconds")
+    start = time.perf_counter()
+
+    waiting_for = dependencies(importers)
+    lines = {importer.name: status.Line(importer.name) for importer in importers}
+    spinners: dict[str, Spinner] = {}
+    running: dict[Future, Importer] = {}
+    pending = list(importers)
+    failed: set[str] = set()
+    errors: list[BaseException] = []
+
+    with (
+        Live(get_renderable=lambda: render(lines, spinners), refresh_per_second=10),
+        ThreadPoolExecutor(len(importers)) as pool,
+    ):
+        while pending or running:
+            for importer in list(pending):
+                if waiting_for[importer.name] & failed:
+                    pending.remove(importer)
+                    failed.add(importer.name)
+                    lines[importer.name].text += " (skipped)"
+                    lines[importer.name].fail("✘")
+                elif not waiting_for[importer.name] & {
+                    other.name for other in pending + list(running.values())
+                }:
+                    pending.remove(importer)
+                    spinners[importer.name] = Spinner("dots")
+                    future = pool.submit(run, importer, lines[importer.name])
+                    running[future] = importer
+
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                importer = running.pop(future)
+                if future.exception() is not None:
+                    failed.add(importer.name)
+                    errors.append(future.exception())
+                    lines[importer.name].fail("✘")
+                elif lines[importer.name].symbol is None:
+                    lines[importer.name].ok("✔")
+
+    wall = time.perf_counter() - start
+    stages = in_order(importers, metrics.stages)
+    Console().print(summary(stages, wall))
+    metrics.save_history(started, wall, [record for record, _ in stages])
 
-def main():
-    atracker_main()
-    strong_main()
-    apple_health_main()
-    incremental_main()
-    workouts_main()
-    routes_main()
-    layers_main()
+    if errors:
+        raise errors[0]
 
 
 if __name__ == "__main__":
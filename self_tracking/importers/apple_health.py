@@ -1,15 +1,36 @@
+import argparse
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from datetime import date, timedelta
+from pathlib import Path
+import re
+import shutil
+from self_tracking.atomic import atomic_path
 from self_tracking.dirs import diary_dir, downloads_dir, cache_dir
-from typing import cast
+from dataclasses import dataclass
+from typing import IO, Any, Callable, Iterable, Iterator, cast
 import xml.etree.ElementTree as ET
-from zipfile import ZipFile
+from zipfile import ZIP_STORED, ZipFile
 import pandas as pd
-from yaspin import yaspin
+from self_tracking.importers import fingerprints, metrics
+from self_tracking.importers.status import status
 
 # %%
 fresh_path = downloads_dir / "export.zip"
 export_path = cache_dir / "apple-health-export.zip"
 xml_sub_path = "apple_health_export/export.xml"
+tables_dir = cache_dir / "apple-health-tables"
+watermark_path = diary_dir / "data/apple-health-watermark.json"
+exports_dir = diary_dir / "data/exports"
+running_manual_path = exports_dir / "running-manual.tsv"
+garmin_path = exports_dir / "garmin.csv"
+weight_manual_path = exports_dir / "weight-manual.tsv"
+
+# How far before the watermark records are read again, to pick up anything that
+# synced to the phone late.
+OVERLAP = timedelta(days=7)
 
 
 def copy_fresh():
@@ -21,49 +42,313 @@ def copy_fresh():
     return False
 
 
-def getroot() -> ET.Element:
+# Only these attributes are kept from each Record, which drops the bulky device
+# and metadata strings that make up most of the export.
+RECORD_ATTRIBS = ("sourceName", "unit", "value", "startDate", "endDate")
+
+Node = dict[str, str]
+
+
+@dataclass
+class Export:
+    export_date: date
+    tables: dict[str, pd.DataFrame]
+    # When set, only data from this day on is extracted and merged into the TSVs.
+    since: date | None = None
+
+    def find(self, type: str) -> pd.DataFrame:
+        return self.tables[type]
+
+    def after(self, since: date | None) -> "Export":
+        if since is None:
+            return self
+        # A day early since some extractors date records by UTC rather than
+        # the exported wall-clock time.
+        start = (since - timedelta(days=1)).isoformat()
+        tables = {t: df.loc[df.endDate >= start] for t, df in self.tables.items()}
+        return Export(self.export_date, tables, since)
+
+
+def export_key() -> str:
+    """Identifies the export by the CRC and size recorded in the zip directory,
+    which is free to read compared to hashing the whole file."""
     with ZipFile(export_path) as zf:
-        return ET.parse(zf.open(xml_sub_path)).getroot()
+        info = zf.getinfo(xml_sub_path)
+    return f"{info.CRC:08x}-{info.file_size}"
 
 
-def get_last_full_day(root: ET.Element):
-    export_date_node = root.find("./ExportDate")
-    if export_date_node is None:
-        raise Exception("Could not find export date")
-    export_date = date.fromisoformat(export_date_node.attrib["value"][0:10])
-    return export_date - timedelta(days=1)
+def get_key_dir() -> Path:
+    key_dir = tables_dir / export_key()
+    if not key_dir.exists():
+        # Anything cached for previous exports will never be read again.
+        shutil.rmtree(tables_dir, ignore_errors=True)
+        key_dir.mkdir(parents=True)
+    return key_dir
 
 
-def parse_start(node):
-    return pd.to_datetime(node.attrib["startDate"], utc=True).tz_convert(
-        "Europe/London"
+# %%
+TOP_LEVEL_RE = re.compile(rb"^ <(\w+)")
+KEY_ATTRIB_RES = {
+    b"Record": re.compile(rb' type="([^"]+)"'),
+    b"Workout": re.compile(rb' workoutActivityType="([^"]+)"'),
+}
+
+Index = dict[str, list[list[int]]]
+
+
+def build_index(file: IO[bytes], copy: IO[bytes] | None = None) -> Index:
+    """Byte ranges covering each Record type, Workout activity type and other
+    top-level tag, with neighbouring elements of the same kind merged.
+
+    This scans lines rather than parsing XML, relying on the export starting
+    each top-level element on a new line indented by exactly one space.
+    """
+    index: Index = {}
+    run: list[int] | None = None
+    offset = 0
+
+    for line in file:
+        if copy:
+            copy.write(line)
+
+        match = TOP_LEVEL_RE.match(line)
+        if match:
+            tag = match.group(1)
+            attrib_re = KEY_ATTRIB_RES.get(tag)
+            found = attrib_re.search(line) if attrib_re else None
+            key = (found.group(1) if found else tag).decode()
+            ranges = index.setdefault(key, [])
+            if ranges and ranges[-1][1] == offset:
+                run = ranges[-1]
+            else:
+                run = [offset, offset]
+                ranges.append(run)
+        elif not line.startswith(b" "):
+            # The root element or the DTD, which belong to no range.
+            run = None
+
+        offset += len(line)
+        if run is not None:
+            run[1] = offset
+
+    return index
+
+
+@contextmanager
+def open_xml(key_dir: Path) -> Iterator[IO[bytes]]:
+    """The export XML as a seekable file: straight from the zip when stored
+    uncompressed, otherwise the copy extracted while indexing."""
+    with ZipFile(export_path) as zf:
+        if zf.getinfo(xml_sub_path).compress_type == ZIP_STORED:
+            with zf.open(xml_sub_path) as file:
+                yield file
+                return
+    with open(key_dir / "export.xml", "rb") as file:
+        yield file
+
+
+def load_index(key_dir: Path) -> Index:
+    index_file = key_dir / "index.json"
+    if not index_file.exists():
+        with ZipFile(export_path) as zf, zf.open(xml_sub_path) as file:
+            if zf.getinfo(xml_sub_path).compress_type == ZIP_STORED:
+                index = build_index(file)
+            else:
+                with (
+                    atomic_path(key_dir / "export.xml") as tmp_file,
+                    open(tmp_file, "wb") as copy,
+                ):
+                    index = build_index(file, copy)
+        index_file.write_text(json.dumps(index))
+    return json.loads(index_file.read_text())
+
+
+def read_ranges(file: IO[bytes], ranges: list[list[int]], chunk_size=1 << 20):
+    """Parse events for just the given byte ranges, as if they were the only
+    children of the root."""
+    parser = ET.XMLPullParser(events=("start", "end"))
+    parser.feed(b"<HealthData>")
+    for start, end in ranges:
+        file.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            chunk = file.read(min(chunk_size, remaining))
+            if not chunk:
+                raise Exception("Export is shorter than its index")
+            remaining -= len(chunk)
+            parser.feed(chunk)
+            yield from parser.read_events()
+    parser.feed(b"</HealthData>")
+    yield from parser.read_events()
+
+
+def top_level(events: Iterable[tuple[str, Any]]) -> Iterator[ET.Element]:
+    """Yield each direct child of the root as soon as it has been parsed.
+
+    Elements are cleared from the root once yielded so the tree never holds more
+    than one of them. Nested elements, like the Records inside a Correlation, are
+    left to their parent.
+    """
+    root = None
+    depth = 0
+    for event, elem in events:
+        if event == "start":
+            if root is None:
+                root = elem
+            depth += 1
+            continue
+
+        depth -= 1
+        if depth == 1 and root is not None:
+            yield elem
+            root.clear()
+
+
+def iter_elements(keys: Iterable[str]) -> Iterator[ET.Element]:
+    """Top-level elements indexed under `keys`, seeking straight to them rather
+    than parsing the rest of the export."""
+    key_dir = get_key_dir()
+    index = load_index(key_dir)
+    ranges = sorted(r for key in keys for r in index.get(key, []))
+    with open_xml(key_dir) as file:
+        yield from top_level(read_ranges(file, ranges))
+
+
+# %%
+def workout_node(elem: ET.Element) -> Node:
+    node = dict(elem.attrib)
+    for stat in elem.iterfind("WorkoutStatistics"):
+        name = stat.attrib["type"].removeprefix("HKQuantityTypeIdentifier")
+        if "sum" in stat.attrib:
+            node[f"{name}.sum"] = stat.attrib["sum"]
+            node[f"{name}.unit"] = stat.attrib["unit"]
+    return node
+
+
+def to_table(nodes: list[Node], columns: Iterable[str] | None = None):
+    """One column per attribute: numbers as floats, dates left as the exported
+    strings and everything else categorical."""
+    df = pd.DataFrame(nodes, columns=columns)
+    for col in df.columns:
+        if col.endswith("Date"):
+            continue
+        try:
+            df[col] = pd.to_numeric(df[col]).astype(float)
+        except (ValueError, TypeError):
+            df[col] = df[col].astype("category")
+    return df
+
+
+def read_export(types: Iterable[str]) -> Export:
+    """Parse only the Records and Workouts of `types` from the export.
+
+    Record types and workout activity types share one namespace since their
+    identifiers have distinct prefixes.
+    """
+    nodes: dict[str, list[Node]] = {t: [] for t in types}
+    export_date = None
+
+    for elem in iter_elements([*nodes, "ExportDate"]):
+        match elem.tag:
+            case "Record":
+                found = nodes.get(elem.attrib["type"])
+                if found is not None:
+                    found.append(
+                        {k: elem.attrib[k] for k in RECORD_ATTRIBS if k in elem.attrib}
+                    )
+            case "Workout":
+                found = nodes.get(elem.attrib["workoutActivityType"])
+                if found is not None:
+                    found.append(workout_node(elem))
+            case "ExportDate":
+                export_date = date.fromisoformat(elem.attrib["value"][0:10])
+
+    if export_date is None:
+        raise Exception("Could not find export date")
+
+    tables = {
+        t: to_table(found, None if t.startswith("HKWorkout") else RECORD_ATTRIBS)
+        for t, found in nodes.items()
+    }
+    return Export(export_date, tables)
+
+
+def cache_export(types: list[str]) -> Path:
+    """Directory holding a table for each of `types`, reading the export only
+    for the types that haven't been cached yet."""
+    key_dir = get_key_dir()
+    date_file = key_dir / "export-date"
+    missing = [t for t in types if not (key_dir / f"{t}.pkl").exists()]
+
+    if missing or not date_file.exists():
+        export = read_export(missing)
+        for t, table in export.tables.items():
+            with atomic_path(key_dir / f"{t}.pkl") as tmp_file:
+                table.to_pickle(tmp_file)
+        date_file.write_text(export.export_date.isoformat())
+
+    return key_dir
+
+
+def load_export(types: Iterable[str]) -> Export:
+    types = list(types)
+    key_dir = cache_export(types)
+    date_file = key_dir / "export-date"
+    return Export(
+        date.fromisoformat(date_file.read_text()),
+        {t: pd.read_pickle(key_dir / f"{t}.pkl") for t in types},
     )
 
 
-def parse_duration(node, expected_unit="min"):
-    if node.attrib["durationUnit"] != expected_unit:
+# Every date in the export is written like "2024-03-10 09:00:00 +0100". Pandas
+# only has a fast path for this without the offset, so that is parsed on its own.
+def parse_local(dates: pd.Series) -> pd.Series:
+    """Wall-clock times in whichever offset the export was written in."""
+    return pd.to_datetime(dates.str[0:19], format="%Y-%m-%d %H:%M:%S")
+
+
+def parse_dates(dates: pd.Series) -> pd.Series:
+    """UTC times, parsing each distinct offset (usually only one) just once."""
+    offsets = dates.str[20:].astype("category")
+    minutes = [
+        int(o[0] + "1") * (int(o[1:3]) * 60 + int(o[3:5]))
+        for o in offsets.cat.categories
+    ]
+    shift = pd.to_timedelta(minutes, unit="min")[offsets.cat.codes]
+    return (parse_local(dates) - shift.values).dt.tz_localize("UTC")
+
+
+def get_last_full_day(export: Export):
+    return export.export_date - timedelta(days=1)
+
+
+def parse_start(df: pd.DataFrame):
+    return parse_dates(df.startDate).dt.tz_convert("Europe/London")
+
+
+def parse_duration(df: pd.DataFrame, expected_unit="min"):
+    if (df.durationUnit != expected_unit).any():
         raise Exception("Unexpected unit found")
-    return float(node.attrib["duration"]) / 60
+    return df.duration / 60
 
 
-def parse_distance(node, name: str, expected_unit="mi"):
-    distance_node = node.find(f"*[@type='HKQuantityTypeIdentifierDistance{name}']")
-    if distance_node is None:
+def parse_distance(df: pd.DataFrame, name: str, expected_unit="mi"):
+    if f"Distance{name}.sum" not in df:
         return None
-    if distance_node.attrib["unit"] != expected_unit:
+    has_distance = df[f"Distance{name}.sum"].notna()
+    if (df.loc[has_distance, f"Distance{name}.unit"] != expected_unit).any():
         raise Exception("Unexpected unit found")
-    return float(distance_node.attrib["sum"])
+    return df[f"Distance{name}.sum"]
 
 
-def parse_calories(node, expected_unit="Cal"):
-    calories_node = node.find("*[@type='HKQuantityTypeIdentifierActiveEnergyBurned']")
-    if calories_node.attrib["unit"] != expected_unit:
+def parse_calories(df: pd.DataFrame, expected_unit="Cal"):
+    if (df["ActiveEnergyBurned.unit"] != expected_unit).any():
         raise Exception("Unexpected unit found")
-    return round(float(calories_node.attrib["sum"]))
+    return df["ActiveEnergyBurned.sum"].round().astype(int)
 
 
 def gather_records(
-    root: ET.Element,
+    export: Export,
     rtype: str,
     unit: str,
     sources: list[str],
@@ -71,28 +356,47 @@ def gather_records(
     fast_date=True,
     utc=True,
 ):
-    df = pd.DataFrame(
-        {
-            "date": (
-                node.attrib["endDate"][0:10]
-                if fast_date
-                else pd.to_datetime(node.attrib["endDate"], utc=utc).date()
-            ),
-            "value": float(node.attrib["value"]),
-        }
-        for node in root.iterfind(f"./Record[@type='HKQuantityTypeIdentifier{rtype}']")
-        if node.attrib["sourceName"] in sources and node.attrib["unit"] == unit
+    df = export.find(f"HKQuantityTypeIdentifier{rtype}")
+    df = df.loc[df.sourceName.isin(sources) & (df.unit == unit)]
+    dates = (
+        df.endDate.str[0:10]
+        if fast_date
+        else (
+            parse_dates(df.endDate).dt.tz_localize(None)
+            if utc
+            else parse_local(df.endDate)
+        ).dt.normalize()
     )
-    series = cast(pd.Series, df.groupby("date").agg(agg)["value"])
+    series = cast(pd.Series, df.value.groupby(dates.rename("date")).agg(agg))
     series.index = pd.to_datetime(series.index)
     return series
 
 
+def merge_since(df: pd.DataFrame, file: Path, since: date, index: bool):
+    """Existing rows from before `since` followed by new rows from `since` on.
+
+    Rows are keyed by the date index, or the start column for events.
+    """
+    existing = pd.read_table(
+        file, dtype=str, keep_default_na=False, index_col=0 if index else None
+    )
+    if index:
+        old = existing.loc[existing.index < since.isoformat()]
+        new = df.loc[df.index >= pd.Timestamp(since)]
+        new.index = new.index.strftime("%Y-%m-%d").rename(df.index.name)
+    else:
+        old = existing.loc[existing.start.str[0:10] < since.isoformat()]
+        new = df.loc[df.start >= pd.Timestamp(since, tz="Europe/London")]
+        new = new.astype({"start": str})
+    return pd.concat([old, new]), len(new)
+
+
 def write_tsv(
     df: pd.DataFrame,
     name: str,
     index=True,
     dp: dict[str, int] = {"duration": 4, "distance": 2},
+    since: date | None = None,
 ):
     df = df.copy()
     for col, decimals in dp.items():
@@ -101,16 +405,18 @@ def write_tsv(
                 lambda x: f"{x:.{decimals}f}" if pd.notnull(x) else ""
             )
 
-    df.to_csv(diary_dir / f"data/{name}.tsv", sep="\t", index=index)
-    return len(df)
+    file = target_path(name)
+    count = len(df)
+    if since is not None and file.exists():
+        df, count = merge_since(df, file, since, index)
+
+    df.to_csv(file, sep="\t", index=index)
+    return count
 
 
 # %%
-def extract_running(root: ET.Element):
-    manual_export = pd.read_table(
-        diary_dir / "data/exports/running-manual.tsv",
-        parse_dates=["date"],
-    )
+def extract_running(export: Export):
+    manual_export = pd.read_table(running_manual_path, parse_dates=["date"])
     running_manual = pd.DataFrame(
         {
             "start": (manual_export.date + pd.Timedelta(hours=12)).dt.tz_localize(
@@ -122,9 +428,7 @@ def extract_running(root: ET.Element):
         }
     )
 
-    garmin_export = pd.read_csv(diary_dir / "data/exports/garmin.csv").query(
-        "`Activity Type` == 'Running'"
-    )
+    garmin_export = pd.read_csv(garmin_path).query("`Activity Type` == 'Running'")
     running_garmin = pd.DataFrame(
         {
             "start": pd.to_datetime(garmin_export.Date).dt.tz_localize("Europe/London"),
@@ -137,37 +441,33 @@ def extract_running(root: ET.Element):
         }
     )
 
+    workouts = export.find("HKWorkoutActivityTypeRunning")
     running_apple = pd.DataFrame(
         {
-            "start": parse_start(node),
-            "duration": parse_duration(node),
-            "distance": parse_distance(node, "WalkingRunning"),
-            "calories": parse_calories(node),
+            "start": parse_start(workouts),
+            "duration": parse_duration(workouts),
+            "distance": parse_distance(workouts, "WalkingRunning"),
+            "calories": parse_calories(workouts),
         }
-        for node in root.iterfind(
-            "./Workout[@workoutActivityType='HKWorkoutActivityTypeRunning']"
-        )
     )
 
     running = pd.concat(
         [running_manual, running_garmin, running_apple], ignore_index=True
     ).sort_values("start")
 
-    return write_tsv(running, "workouts/running", index=False)
+    return write_tsv(running, "workouts/running", index=False, since=export.since)
 
 
 # %%
-def extract_cycling(root: ET.Element):
+def extract_cycling(export: Export):
+    workouts = export.find("HKWorkoutActivityTypeCycling")
     cycling_mixed = pd.DataFrame(
         {
-            "start": parse_start(node),
-            "duration": parse_duration(node),
-            "distance": parse_distance(node, "Cycling"),
-            "calories": parse_calories(node),
+            "start": parse_start(workouts),
+            "duration": parse_duration(workouts),
+            "distance": parse_distance(workouts, "Cycling"),
+            "calories": parse_calories(workouts),
         }
-        for node in root.iterfind(
-            "./Workout[@workoutActivityType='HKWorkoutActivityTypeCycling']"
-        )
     )
 
     is_indoor = cycling_mixed["distance"].isna() | (cycling_mixed["distance"] == 0)
@@ -176,125 +476,124 @@ def extract_cycling(root: ET.Element):
 
     cycling_outdoor = cycling_mixed[~is_indoor]
 
-    c1 = write_tsv(cycling_indoor, "workouts/cycling-indoor", index=False)
-    c2 = write_tsv(cycling_outdoor, "workouts/cycling", index=False)
+    c1 = write_tsv(
+        cycling_indoor, "workouts/cycling-indoor", index=False, since=export.since
+    )
+    c2 = write_tsv(cycling_outdoor, "workouts/cycling", index=False, since=export.since)
     return c1 + c2
 
 
 # %%
-def extract_activity(root: ET.Element):
+def extract_activity(export: Export):
     activity_sources = ["David’s Apple\xa0Watch"]
 
     activity = pd.DataFrame(
         {
             "active_calories": gather_records(
-                root, "ActiveEnergyBurned", "Cal", activity_sources
+                export, "ActiveEnergyBurned", "Cal", activity_sources
             ),
         }
     )
 
-    activity = activity.loc["2017-12-16" : get_last_full_day(root)].round(0).astype(int)
+    activity = (
+        activity.loc["2017-12-16" : get_last_full_day(export)].round(0).astype(int)
+    )
 
-    return write_tsv(activity, "activity")
+    return write_tsv(activity, "activity", since=export.since)
 
 
 # %%
-def extract_diet(root: ET.Element):
+def extract_diet(export: Export):
     diet_sources = ["Calorie Counter", "Yazio", "MyNetDiary"]
 
     diet = pd.concat(
         {
             "calories": gather_records(
-                root,
+                export,
                 "DietaryEnergyConsumed",
                 "Cal",
                 diet_sources,
                 fast_date=False,
             ),
             "protein": gather_records(
-                root, "DietaryProtein", "g", diet_sources, fast_date=False
+                export, "DietaryProtein", "g", diet_sources, fast_date=False
             ),
             "fat": gather_records(
-                root, "DietaryFatTotal", "g", diet_sources, fast_date=False
+                export, "DietaryFatTotal", "g", diet_sources, fast_date=False
             ),
             "carbs": gather_records(
-                root, "DietaryCarbohydrates", "g", diet_sources, fast_date=False
+                export, "DietaryCarbohydrates", "g", diet_sources, fast_date=False
             ),
             "sugar": gather_records(
-                root, "DietarySugar", "g", diet_sources, fast_date=False
+                export, "DietarySugar", "g", diet_sources, fast_date=False
             ),
             "fiber": gather_records(
-                root, "DietaryFiber", "g", diet_sources, fast_date=False
+                export, "DietaryFiber", "g", diet_sources, fast_date=False
             ),
         },
         axis=1,
     ).astype(int)
 
-    diet = diet.loc[: get_last_full_day(root)]
+    diet = diet.loc[: get_last_full_day(export)]
 
-    return write_tsv(diet, "diet")
+    return write_tsv(diet, "diet", since=export.since)
 
 
 # %%
-def extract_weight(root: ET.Element):
+def extract_weight(export: Export):
     weight_sources = ["Withings"]
 
     weight_new = pd.concat(
         {
-            "weight": gather_records(root, "BodyMass", "lb", weight_sources, agg="min"),
+            "weight": gather_records(
+                export, "BodyMass", "lb", weight_sources, agg="min"
+            ),
             "fat": gather_records(
-                root, "BodyFatPercentage", "%", weight_sources, agg="min"
+                export, "BodyFatPercentage", "%", weight_sources, agg="min"
             ),
         },
         axis=1,
     )
 
     weight_manual = pd.read_table(
-        diary_dir / "data/exports/weight-manual.tsv",
-        parse_dates=["date"],
-        index_col="date",
+        weight_manual_path, parse_dates=["date"], index_col="date"
     )
 
     weight = pd.concat([weight_manual, weight_new])
 
-    return write_tsv(weight, "weight", dp={"weight": 2, "fat": 3})
+    return write_tsv(weight, "weight", dp={"weight": 2, "fat": 3}, since=export.since)
 
 
 # %%
-def extract_meditation(root: ET.Element):
+def extract_meditation(export: Export):
+    sessions = export.find("HKCategoryTypeIdentifierMindfulSession")
     df = pd.DataFrame(
         {
-            "start": parse_start(node),
+            "start": parse_start(sessions),
             "duration": (
-                pd.to_datetime(node.attrib["endDate"])
-                - pd.to_datetime(node.attrib["startDate"])
-            ).total_seconds()
+                parse_dates(sessions.endDate) - parse_dates(sessions.startDate)
+            ).dt.total_seconds()
             / (60 * 60),
         }
-        for node in root.iterfind(
-            "./Record[@type='HKCategoryTypeIdentifierMindfulSession']"
-        )
     )
 
     df = df.loc[df.duration >= (1 / 60)]
 
-    return write_tsv(df, "meditation", index=False)
+    return write_tsv(df, "meditation", index=False, since=export.since)
 
 
 # %%
-def extract_sleep(root: ET.Element):
+def extract_sleep(export: Export):
     sleep_sources = ["David’s Apple\xa0Watch"]
 
+    records = export.find("HKCategoryTypeIdentifierSleepAnalysis")
     sleep = pd.DataFrame(
         {
-            "source": x.attrib["sourceName"],
-            "start": pd.to_datetime(x.attrib["startDate"]),
-            "end": pd.to_datetime(x.attrib["endDate"]),
-            "subtype": x.attrib["value"][28:],
+            "source": records.sourceName,
+            "start": parse_dates(records.startDate),
+            "end": parse_dates(records.endDate),
+            "subtype": records.value.str[28:],
         }
-        for x in root.iterfind(
-            "./Record[@type='HKCategoryTypeIdentifierSleepAnalysis']"
-        )
     )
 
     # Note: A lot of potential data in an older format is being discarded here.
@@ -307,38 +606,228 @@ def extract_sleep(root: ET.Element):
 
     sleep["duration"] = (sleep.end - sleep.start).dt.total_seconds() / (60 * 60)
 
-    sleep["date"] = pd.to_datetime((sleep.end + timedelta(hours=8)).dt.date)
+    # Dated by the clock the export was written in, not UTC.
+    sleep["date"] = pd.to_datetime(
+        (parse_local(records.endDate) + timedelta(hours=8)).dt.date
+    )
 
     columns = ["Deep", "Core", "REM", "Awake"]
 
-    sleep_pivot = sleep.pivot_table(
-        index="date", columns="subtype", values="duration", aggfunc="sum"
-    ).fillna(0.0)[columns]
+    sleep_pivot = (
+        sleep.pivot_table(
+            index="date", columns="subtype", values="duration", aggfunc="sum"
+        )
+        .reindex(columns=columns, fill_value=0.0)
+        .fillna(0.0)
+    )
 
-    return write_tsv(sleep_pivot, "sleep", dp={c: 4 for c in columns})
+    return write_tsv(
+        sleep_pivot, "sleep", dp={c: 4 for c in columns}, since=export.since
+    )
 
 
 # %%
-def main():
-    with yaspin(text="Apple Health") as spinner:
+DIET_TYPES = [
+    f"HKQuantityTypeIdentifier{t}"
+    for t in [
+        "DietaryEnergyConsumed",
+        "DietaryProtein",
+        "DietaryFatTotal",
+        "DietaryCarbohydrates",
+        "DietarySugar",
+        "DietaryFiber",
+    ]
+]
+
+# Which Record and Workout types each extractor reads, so the export can be
+# streamed once and only the interesting nodes kept.
+EXTRACTORS: dict[Callable[[Export], int], list[str]] = {
+    extract_running: ["HKWorkoutActivityTypeRunning"],
+    extract_cycling: ["HKWorkoutActivityTypeCycling"],
+    extract_activity: ["HKQuantityTypeIdentifierActiveEnergyBurned"],
+    extract_diet: DIET_TYPES,
+    extract_weight: [
+        "HKQuantityTypeIdentifierBodyMass",
+        "HKQuantityTypeIdentifierBodyFatPercentage",
+    ],
+    extract_meditation: ["HKCategoryTypeIdentifierMindfulSession"],
+    extract_sleep: ["HKCategoryTypeIdentifierSleepAnalysis"],
+}
+
+# Files kept by hand that some extractors read in full. The watermark can't
+# tell when they've been edited, so their hashes are kept alongside it.
+MANUAL_EXPORTS: dict[Callable[[Export], int], list[Path]] = {
+    extract_running: [running_manual_path, garmin_path],
+    extract_weight: [weight_manual_path],
+}
+
+# The TSVs each extractor writes under data.
+TARGETS: dict[Callable[[Export], int], list[str]] = {
+    extract_running: ["workouts/running"],
+    extract_cycling: ["workouts/cycling-indoor", "workouts/cycling"],
+    extract_activity: ["activity"],
+    extract_diet: ["diet"],
+    extract_weight: ["weight"],
+    extract_meditation: ["meditation"],
+    extract_sleep: ["sleep"],
+}
+
+
+def target_path(name: str) -> Path:
+    return diary_dir / f"data/{name}.tsv"
+
+
+def read_watermark() -> dict:
+    if not watermark_path.exists():
+        return {}
+    return json.loads(watermark_path.read_text())
+
+
+def get_since(watermark: dict, types: list[str]) -> date | None:
+    """First day to extract for `types`, or None for everything."""
+    last_ends = [watermark.get("types", {}).get(t) for t in types]
+    if None in last_ends:
+        return None
+    return date.fromisoformat(min(last_ends)[0:10]) - OVERLAP
+
+
+def manual_hashes() -> dict[str, str | None]:
+    """Each manual export's content hash, or None if it's missing."""
+    hashes = {}
+    for paths in MANUAL_EXPORTS.values():
+        for path in paths:
+            found = fingerprints.fingerprint(path)
+            hashes[path.name] = found[2] if found else None
+    return hashes
+
+
+def needs_full(
+    extract: Callable[[Export], int], watermark: dict, manual: dict[str, str | None]
+) -> bool:
+    """Whether `extract` has to start again from the beginning, because a TSV
+    it writes is missing or a manual export it reads has changed since the
+    watermark was left."""
+    if not all(target_path(name).exists() for name in TARGETS[extract]):
+        return True
+    known = watermark.get("manual", {})
+    return any(
+        known.get(path.name) != manual[path.name]
+        for path in MANUAL_EXPORTS.get(extract, [])
+    )
+
+
+def run_extractor(
+    extract: Callable[[Export], int], types: list[str], since: date | None
+) -> tuple[int, dict[str, str], metrics.Stage]:
+    """Extract from `since` on, returning the count, each type's last end and
+    how long it took."""
+    with metrics.stage(extract.__name__) as extract_stage:
+        export = load_export(types).after(since)
+        count = extract(export)
+        metrics.rows(rows_in=sum(len(export.tables[t]) for t in types), rows_out=count)
+    last_ends = {
+        t: export.tables[t].endDate.max() for t in types if len(export.tables[t])
+    }
+    return count, last_ends, extract_stage
+
+
+def main(jobs: int | None = None, full=False):
+    """Run the extractors across `jobs` processes (one per core by default), or
+    in this process if `jobs` is 1. Each one only loads the tables it reads.
+
+    Unless `full` is set, only data since the watermark left by the last import
+    (less the overlap) is extracted and merged into the existing TSVs. An
+    extractor starts from the beginning anyway if a TSV it writes is missing
+    or a manual export it reads has changed.
+    """
+    with status("Apple Health") as spinner:
         if not copy_fresh():
             spinner.text += " (skipped)"
             spinner.ok("→")
             return
 
-        count = 0
-        root = getroot()
-        count += extract_running(root)
-        count += extract_cycling(root)
-        count += extract_activity(root)
-        count += extract_diet(root)
-        count += extract_weight(root)
-        count += extract_meditation(root)
-        count += extract_sleep(root)
-
-        spinner.text += f" ({count} total records)"
+        # The same export downloaded again, with nothing else to pick up.
+        manual_paths = [path for paths in MANUAL_EXPORTS.values() for path in paths]
+        target_paths = [
+            target_path(name) for names in TARGETS.values() for name in names
+        ]
+        sources = [export_path, *manual_paths, *target_paths]
+        if fingerprints.changed("apple-health", sources) is None and not full:
+            spinner.text += " (unchanged)"
+            spinner.ok("→")
+            return
+
+        # One pass over the export for anything not cached yet, so the
+        # extractors never parse the XML themselves.
+        cache_export([t for types in EXTRACTORS.values() for t in types])
+
+        watermark = {} if full else read_watermark()
+        manual = manual_hashes()
+        restart = {
+            extract for extract in EXTRACTORS if needs_full(extract, watermark, manual)
+        }
+
+        # Only those starting again have anything new in an export already seen.
+        export_date = load_export([]).export_date
+        extractors = EXTRACTORS
+        if watermark.get("exportDate", "") >= export_date.isoformat():
+            extractors = {e: t for e, t in EXTRACTORS.items() if e in restart}
+        if not extractors:
+            fingerprints.record("apple-health", fingerprints.take(sources))
+            spinner.text += " (already imported)"
+            spinner.ok("→")
+            return
+
+        sinces = [
+            None if extract in restart else get_since(watermark, types)
+            for extract, types in extractors.items()
+        ]
+        args = (extractors, extractors.values(), sinces)
+
+        if jobs == 1:
+            results = list(map(run_extractor, *args))
+        else:
+            # Forking copies whatever locks other threads hold, such as the
+            # other importers' when run from importers/all.
+            context = multiprocessing.get_context("forkserver")
+            with ProcessPoolExecutor(max_workers=jobs, mp_context=context) as pool:
+                results = list(pool.map(run_extractor, *args))
+            for _, _, extract_stage in results:
+                metrics.adopt(extract_stage, metrics.current())
+
+        last_ends = watermark.get("types", {})
+        for _, ends, _ in results:
+            last_ends.update(ends)
+        watermark_path.write_text(
+            json.dumps(
+                {
+                    "exportDate": export_date.isoformat(),
+                    "types": last_ends,
+                    "manual": manual,
+                },
+                indent=2,
+            )
+            + "\n"
+        )
+
+        fingerprints.record("apple-health", fingerprints.take(sources))
+        count = sum(count for count, _, _ in results)
+        metrics.rows(rows_out=count)
+        spinner.text += f" ({count} new/updated records)"
         spinner.ok("✔")
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        help="Processes to run the extractors in (default: one per core)",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Extract everything instead of only what's new since the watermark",
+    )
+    args = parser.parse_args()
+    main(jobs=args.jobs, full=args.full)
@@ -1,10 +1,17 @@
 from datetime import timedelta
-from self_tracking.dirs import diary_dir
+from self_tracking.importers.upsert import Dataset
 import re
 import subprocess
-from yaspin import yaspin
+from self_tracking.importers import metrics
+from self_tracking.importers.status import status
 import pandas as pd
 
+dataset = Dataset(
+    "atracker",
+    keys=["start", "category"],
+    sort_by="start",
+    sort_key=lambda start: pd.to_datetime(start, utc=True).dt.tz_localize(None),
+)
 
 event_regex = re.compile(
     r"^• (?P<category>[A-Za-z ]+)\n"
@@ -66,33 +73,16 @@ def get_events(since: str):
 
 
 def import_events():
-    existing_df = pd.read_table(diary_dir / "data/atracker.tsv")
-    existing_df["start"] = pd.to_datetime(existing_df.start, utc=True).dt.tz_convert(
-        "Europe/London"
-    )
-
-    since = existing_df.iloc[-1].start - timedelta(days=7)
+    since = pd.Timestamp(dataset.last()).tz_convert("Europe/London") - timedelta(days=7)
     new_df = get_events(since)
-
-    merged_df = (
-        pd.concat([existing_df, new_df])
-        .sort_values("start")
-        .drop_duplicates(["start", "category"])
-        .reset_index(drop=True)
-    )
-
-    merged_df.to_csv(
-        diary_dir / "data/atracker.tsv",
-        sep="\t",
-        index=False,
-        float_format="%.4f",
-    )
-    return merged_df.shape[0] - existing_df.shape[0]
+    metrics.rows(rows_in=new_df.shape[0])
+    return dataset.upsert(new_df, float_format="%.4f")
 
 
 def main():
-    with yaspin(text="ATracker") as spinner:
+    with status("ATracker") as spinner:
         added_count = import_events()
+        metrics.rows(rows_out=added_count)
         spinner.text += f" ({added_count} events)"
         spinner.ok("✔")
 
@@ -1,12 +1,13 @@
 from io import StringIO
 from self_tracking.dirs import diary_dir
 import subprocess
-from yaspin import yaspin
+from self_tracking.importers import fingerprints
+from self_tracking.importers.status import status
 import pandas as pd
 
 
 def main():
-    with yaspin(text="Climbing") as spinner:
+    with status("Climbing") as spinner:
         result = subprocess.run(
             ["shortcuts", "run", "Climbing Export"],
             check=True,
@@ -14,6 +15,12 @@ def main():
             text=True,
         )
 
+        prints = fingerprints.changed("climbing", [], {"stdout": result.stdout})
+        if prints is None:
+            spinner.text += " (unchanged)"
+            spinner.ok("→")
+            return
+
         df = pd.read_table(
             StringIO(result.stdout), header=None, names=["start", "end", "title"]
         )
@@ -32,6 +39,7 @@ def main():
             float_format="%.4f",
         )
 
+        fingerprints.record("climbing", prints)
         spinner.text += f" ({df.shape[0]} events)"
         spinner.ok("✔")
 
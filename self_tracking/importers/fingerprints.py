@@ -0,0 +1,83 @@
+import hashlib
+import json
+import threading
+from pathlib import Path
+from self_tracking.atomic import write_atomic
+from self_tracking.dirs import cache_dir
+
+store_path = cache_dir / "import-fingerprints.json"
+store_lock = threading.Lock()
+
+
+def load_store() -> dict[str, dict[str, list]]:
+    if store_path.exists():
+        return json.loads(store_path.read_text())
+    return {}
+
+
+def recorded(stage: str) -> dict[str, list]:
+    with store_lock:
+        return load_store().get(stage, {})
+
+
+def fingerprint(path: Path, known: list | None = None) -> list | None:
+    """Size, mtime and content hash of a file, or just the first two for a
+    directory. The hash is only worked out again if the size or mtime differ
+    from `known`, so an untouched file is never read."""
+    if not path.exists():
+        return None
+    stat = path.stat()
+    if path.is_dir():
+        return [stat.st_size, stat.st_mtime_ns, None]
+    if known and known[:2] == [stat.st_size, stat.st_mtime_ns]:
+        return known
+    with path.open("rb") as f:
+        digest = hashlib.file_digest(f, "sha256").hexdigest()
+    return [stat.st_size, stat.st_mtime_ns, digest]
+
+
+def take(
+    paths: list[Path],
+    contents: dict[str, str] | None = None,
+    known: dict[str, list] | None = None,
+) -> dict[str, list]:
+    """Fingerprints of `paths`, and of any `contents` by name, reusing hashes
+    from `known` for files whose size and mtime match."""
+    known = known or {}
+    prints = {str(path): fingerprint(path, known.get(str(path))) for path in paths}
+    for name, text in (contents or {}).items():
+        digest = hashlib.sha256(text.encode()).hexdigest()
+        prints[name] = [len(text), None, digest]
+    return prints
+
+
+def changed(
+    stage: str, paths: list[Path], contents: dict[str, str] | None = None
+) -> dict[str, list] | None:
+    """The fingerprints of `paths`, and of any `contents` by name, if anything
+    differs from when `stage` last recorded them, or else None.
+
+    Files are compared by content hash, so one rewritten with the same bytes
+    still counts as unchanged.
+    """
+    known = recorded(stage)
+    prints = take(paths, contents, known)
+
+    def contents_of(prints: dict[str, list]):
+        # Directories have no hash, so their size and mtime stand in for it.
+        return {key: value and (value[2] or value) for key, value in prints.items()}
+
+    if contents_of(prints) == contents_of(known):
+        if prints != known:
+            # Keep the new mtimes so the files aren't hashed again next time.
+            record(stage, prints)
+        return None
+    return prints
+
+
+def record(stage: str, prints: dict[str, list]):
+    """Note what `stage` has now processed, once it has finished."""
+    with store_lock:
+        store = load_store()
+        store[stage] = prints
+        write_atomic(store_path, json.dumps(store))
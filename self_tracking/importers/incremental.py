@@ -1,8 +1,14 @@
-from self_tracking.dirs import diary_dir, icloud_dir
+from self_tracking.dirs import icloud_dir
+from self_tracking.importers.upsert import Dataset
 from pathlib import Path
-from yaspin import yaspin
+from self_tracking.importers import fingerprints, metrics
+from self_tracking.importers.status import status
 import pandas as pd
 
+activity_data = Dataset("activity", keys=["date"], sort_by="date")
+diet_data = Dataset("diet", keys=["date"], sort_by="date")
+weight_data = Dataset("weight", keys=["date"], sort_by="date")
+
 
 def get_latest_and_cleanup(dir: Path, pattern: str = "*.txt"):
     files = sorted(dir.glob(pattern))
@@ -18,6 +24,12 @@ def activity():
     if not import_file:
         return 0
 
+    # The TSV is fingerprinted along with the import, since Apple Health
+    # rewrites it and may drop rows added here.
+    sources = [import_file, activity_data.file]
+    if fingerprints.changed("incremental/activity", sources) is None:
+        return 0
+
     df = pd.read_csv(import_file)
     df = df.rename(
         columns={"Date": "date", "Active energy burned(Cal)": "active_calories"}
@@ -25,14 +37,9 @@ def activity():
     df = df.iloc[:-1]
     df["active_calories"] = df.active_calories.round(0).astype(int)
 
-    data_file = diary_dir / "data/activity.tsv"
-    existing_df = pd.read_table(data_file)
-    old_size = existing_df.shape[0]
-
-    new_df = pd.concat([existing_df, df.loc[~df.date.isin(existing_df.date)]])
-    new_df.to_csv(data_file, index=False, sep="\t")
-
-    return new_df.shape[0] - old_size
+    count = activity_data.upsert(df)
+    fingerprints.record("incremental/activity", fingerprints.take(sources))
+    return count
 
 
 def eaten():
@@ -40,19 +47,18 @@ def eaten():
     if not import_file:
         return 0
 
+    sources = [import_file, diet_data.file]
+    if fingerprints.changed("incremental/diet", sources) is None:
+        return 0
+
     df = pd.read_csv(import_file)
     df = df.rename(columns={"Date": "date", "Energy consumed(Cal)": "calories"})
     df = df.iloc[:-1]
     df["calories"] = df.calories.round(0).astype(int)
 
-    data_file = diary_dir / "data/diet.tsv"
-    existing_df = pd.read_table(data_file, dtype=str)
-    old_size = existing_df.shape[0]
-
-    new_df = pd.concat([existing_df, df.loc[~df.date.isin(existing_df.date)]])
-    new_df.to_csv(data_file, index=False, sep="\t")
-
-    return new_df.shape[0] - old_size
+    count = diet_data.upsert(df)
+    fingerprints.record("incremental/diet", fingerprints.take(sources))
+    return count
 
 
 def weight():
@@ -61,6 +67,10 @@ def weight():
     if not import_file or not fat_import_file:
         return 0
 
+    sources = [import_file, fat_import_file, weight_data.file]
+    if fingerprints.changed("incremental/weight", sources) is None:
+        return 0
+
     df = pd.read_csv(import_file, parse_dates=["Date"])
     df = df.rename(columns={"Date": "date", "Body mass(lb)": "weight"})
 
@@ -79,23 +89,19 @@ def weight():
 
     df = df.reset_index()
 
-    data_file = diary_dir / "data/weight.tsv"
-    existing_df = pd.read_table(data_file, dtype=str)
-    old_size = existing_df.shape[0]
-
-    new_df = pd.concat([existing_df, df.loc[~df.date.isin(existing_df.date)]])
-    new_df.to_csv(data_file, index=False, sep="\t")
-
-    return new_df.shape[0] - old_size
+    count = weight_data.upsert(df)
+    fingerprints.record("incremental/weight", fingerprints.take(sources))
+    return count
 
 
 def main():
-    with yaspin(text="Apple Health incremental") as spinner:
+    with status("Apple Health incremental") as spinner:
         count = 0
         count += activity()
         count += eaten()
         count += weight()
 
+        metrics.rows(rows_out=count)
         spinner.text += f" ({count} records)"
         spinner.ok("✔")
 
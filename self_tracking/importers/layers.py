@@ -1,15 +1,54 @@
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+import hashlib
 import json
 import re
+import threading
+from pathlib import Path
+from typing import Callable
 
-from self_tracking.dirs import diary_dir
+from self_tracking.atomic import write_atomic
+from self_tracking.dirs import cache_dir, diary_dir
 
+import numpy as np
 import pandas as pd
-from yaspin import yaspin
+from self_tracking.importers import fingerprints, metrics
+from self_tracking.importers.status import status
 
 import self_tracking.data as d
 
+diary_manifest_path = cache_dir / "diary-layers.json"
+layer_hashes_path = cache_dir / "layer-hashes.json"
+
 
 # %%
+# Layer id -> [sha256, mtime_ns, size] of its file when last written or checked,
+# loaded and saved around main().
+layer_hashes: dict[str, list] = {}
+layer_hashes_lock = threading.Lock()
+
+# Layer id -> (payload, ndigits) for every layer built, while main() is asked to
+# write the packed format too.
+packed_layers: dict[str, tuple[dict, int]] | None = None
+
+
+def file_version(file: Path) -> list[int]:
+    stat = file.stat()
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def load_layer_hashes():
+    if layer_hashes_path.exists():
+        layer_hashes.update(json.loads(layer_hashes_path.read_text()))
+
+
+def save_layer_hashes():
+    with layer_hashes_lock:
+        contents = json.dumps(layer_hashes)
+    write_atomic(layer_hashes_path, contents)
+
+
 def write_layer(
     series,
     group: str,
@@ -23,7 +62,6 @@ def write_layer(
 ) -> int:
     file = diary_dir / "layers" / group / f"{name}.json"
     file.parent.mkdir(parents=True, exist_ok=True)
-    old_contents = file.read_text() if file.exists() else None
 
     series = series[series > 0]
     data = {
@@ -40,15 +78,99 @@ def write_layer(
         "data": data,
     }
     new_contents = json.dumps(payload, indent=2) + "\n"
-
-    has_changed = old_contents != new_contents
+    digest = hashlib.sha256(new_contents.encode()).hexdigest()
+
+    key = f"{group}/{name}"
+    with layer_hashes_lock:
+        known = layer_hashes.get(key)
+    if file.exists():
+        # Trust the recorded hash only while the file is as it was left.
+        if known and known[1:] == file_version(file):
+            has_changed = known[0] != digest
+        else:
+            has_changed = file.read_text() != new_contents
+    else:
+        has_changed = True
 
     if has_changed:
-        file.write_text(new_contents)
+        # Renamed into place so anything reading layers/ never sees half a file.
+        write_atomic(file, new_contents)
+
+    with layer_hashes_lock:
+        layer_hashes[key] = [digest, *file_version(file)]
+        if packed_layers is not None:
+            packed_layers[key] = (payload, ndigits)
 
     return int(has_changed)
 
 
+# %%
+def pack_layer(data: dict[str, float], ndigits: int) -> tuple[str, bytes, bytes]:
+    """A layer's values as one int32 per day from its first date to its last,
+    scaled by 10**ndigits, and a bitmap of the days that have one."""
+    days = pd.to_datetime(pd.Index(data.keys()))
+    if days.empty:
+        return "", b"", b""
+    start = days.min()
+    offsets = (days - start).days.to_numpy()
+
+    length = offsets.max() + 1
+    values = np.zeros(length, dtype="<i4")
+    values[offsets] = np.round(np.array(list(data.values())) * 10**ndigits)
+    valid = np.zeros(length, dtype=bool)
+    valid[offsets] = True
+    return (
+        start.strftime("%Y-%m-%d"),
+        values.tobytes(),
+        np.packbits(valid, bitorder="little").tobytes(),
+    )
+
+
+def write_packed_layers(layers: dict[str, tuple[dict, int]]):
+    """Every layer in one binary file, described by layers/index.json.
+
+    Consumers read the index, then slice each layer's values and validity out
+    of the binary file by offset, instead of parsing one JSON file per layer.
+    Sections are padded to 4 bytes so values can be viewed as int32 in place.
+    """
+    layers_dir = diary_dir / "layers"
+    blob = bytearray()
+    entries = []
+
+    def append(section: bytes) -> int:
+        offset = len(blob)
+        blob.extend(section)
+        blob.extend(b"\0" * (-len(blob) % 4))
+        return offset
+
+    for key, (payload, ndigits) in sorted(layers.items()):
+        start, values, valid = pack_layer(payload["data"], ndigits)
+        entries.append(
+            {
+                **{k: v for k, v in payload.items() if k != "data"},
+                "start": start,
+                "length": len(values) // 4,
+                "ndigits": ndigits,
+                "values": append(values),
+                "valid": append(valid),
+            }
+        )
+
+    # Named by content, so the index only ever points at a complete file.
+    name = f"layers-{hashlib.sha256(blob).hexdigest()[:12]}.bin"
+    index = {"file": name, "layers": entries}
+    index_file = layers_dir / "index.json"
+    if index_file.exists() and json.loads(index_file.read_text()) == index:
+        return
+
+    write_atomic(layers_dir / name, blob)
+    write_atomic(index_file, json.dumps(index, indent=2) + "\n")
+
+    for old_file in layers_dir.glob("layers-*.bin"):
+        if old_file.name != name:
+            old_file.unlink()
+
+
 # %%
 def streaks_layers():
     streaks = d.streaks()
@@ -203,6 +325,7 @@ def git_layers():
 # %%
 def work_git_layers():
     file = diary_dir / "data/exports/work-commits.tsv"
+    d.track(file)
     commits = pd.read_csv(file, sep="\t", parse_dates=["date"])
 
     repo_counts = commits.groupby("repo").size().sort_values(ascending=False)
@@ -230,17 +353,43 @@ SCANNED_RE = re.compile(r"!\[\]\(scanned-\d+\.\w+\)")
 AUDIO_RE = re.compile(r"!\[\]\(audio-\d+-\d+\.\w+\)")
 
 
+def diary_counts(file: Path) -> list[int]:
+    text = file.read_text()
+    return [
+        len(text.split()),
+        len(SCANNED_RE.findall(text)),
+        len(AUDIO_RE.findall(text)),
+    ]
+
+
 def diary_layers():
+    # Entry path -> [mtime_ns, size, wordcount, scanned, audio], so only new or
+    # edited entries are read again.
+    old_manifest = (
+        json.loads(diary_manifest_path.read_text())
+        if diary_manifest_path.exists()
+        else {}
+    )
+    manifest = {}
+
     wordcounts = {}
     scanned = {}
     audio = {}
     for file in (diary_dir / "entries").glob("*/*/*/diary.md"):
         year, month, day = file.parts[-4:-1]
         date = pd.Timestamp(f"{year}-{month}-{day}")
-        text = file.read_text()
-        wordcounts[date] = len(text.split())
-        scanned[date] = len(SCANNED_RE.findall(text))
-        audio[date] = len(AUDIO_RE.findall(text))
+
+        key = str(file.relative_to(diary_dir))
+        version = file_version(file)
+        entry = old_manifest.get(key)
+        if entry is None or entry[:2] != version:
+            entry = version + diary_counts(file)
+        manifest[key] = entry
+
+        wordcounts[date], scanned[date], audio[date] = entry[2:]
+
+    if manifest != old_manifest:
+        write_atomic(diary_manifest_path, json.dumps(manifest))
 
     def to_series(d):
         s = pd.Series(d).sort_index()
@@ -282,20 +431,95 @@ def diary_layers():
 
 
 # %%
-def main():
-    with yaspin(text="Layers") as spinner:
-        count = 0
-        count += streaks_layers()
-        count += atracker_layers()
-        count += workout_layers()
-        count += health_layers()
-        count += misc_layers()
-        count += git_layers()
-        count += work_git_layers()
-        count += diary_layers()
+LAYER_GROUPS = {
+    "streaks": streaks_layers,
+    "atracker": atracker_layers,
+    "workouts": workout_layers,
+    "health": health_layers,
+    "misc": misc_layers,
+    "git": git_layers,
+    "work-git": work_git_layers,
+    "diary": diary_layers,
+}
+
+
+# Finds its entries by globbing, so a new one wouldn't show up as a changed
+# file. Its manifest already skips the entries that haven't changed.
+ALWAYS_BUILT = {"diary"}
+
+
+def build_if_changed(name: str, build: Callable[[], int]) -> int | None:
+    """Build a layer group unless none of the files it read last time, its
+    layers or the code building them have changed since. Returns None if it
+    was skipped.
+
+    None of the layers depend on today's date, unlike some accessors.
+    """
+    stage = f"layers/{name}"
+    code = [Path(__file__), Path(d.__file__), diary_dir / "layers" / name]
+    known = fingerprints.recorded(stage)
+    if known and name not in ALWAYS_BUILT and packed_layers is None:
+        if fingerprints.changed(stage, [Path(path) for path in known]) is None:
+            return None
+
+    with d.tracking() as files:
+        count = build()
+    fingerprints.record(stage, fingerprints.take([*code, *sorted(files)], known=known))
+    return count
+
+
+def timed(
+    name: str, build: Callable[[], int | None], parent: metrics.Stage | None
+) -> tuple[int | None, float]:
+    with metrics.stage(name, parent) as group_stage:
+        count = build()
+        metrics.rows(rows_out=count)
+    return count, group_stage.wall
+
+
+def main(packed=False):
+    """Build every layer group, and with `packed` also the binary layer file
+    and its index alongside the JSON layers."""
+    global packed_layers
+    packed_layers = {} if packed else None
+
+    with status("Layers") as spinner:
+        load_layer_hashes()
+
+        # Each group writes its own directory. Threads rather than processes
+        # since the groups mostly wait on files and git, and a process would
+        # spend longer importing pandas than most groups take to run.
+        with ThreadPoolExecutor(len(LAYER_GROUPS)) as pool:
+            layers_stage = metrics.current()
+            futures = {
+                pool.submit(
+                    timed, name, partial(build_if_changed, name, build), layers_stage
+                ): name
+                for name, build in LAYER_GROUPS.items()
+            }
+            count = 0
+            for future in as_completed(futures):
+                group_count, seconds = future.result()
+                if group_count is None:
+                    spinner.write(f"  {futures[future]} (unchanged)")
+                else:
+                    count += group_count
+                    spinner.write(f"  {futures[future]} ({seconds:.2f}s)")
+
+        save_layer_hashes()
+        if packed_layers is not None:
+            write_packed_layers(packed_layers)
+        metrics.rows(rows_out=count)
         spinner.text += f" ({count} layers)"
         spinner.ok("✔")
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--packed",
+        action="store_true",
+        help="Also write every layer into one binary file with an index",
+    )
+    args = parser.parse_args()
+    main(packed=args.packed)
@@ -0,0 +1,109 @@
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+import json
+import resource
+import sys
+import threading
+import time
+from self_tracking.dirs import cache_dir
+
+history_path = cache_dir / "import-metrics.jsonl"
+
+
+@dataclass(eq=False)
+class Stage:
+    name: str
+    parent: str | None = None
+    wall: float = 0.0
+    cpu: float = 0.0
+    # The process's high-water mark when the stage finished, in bytes.
+    peak_rss: int = 0
+    rows_in: int | None = None
+    rows_out: int | None = None
+
+
+# Every stage finished since the last reset, in the order they finished.
+stages: list[Stage] = []
+stages_lock = threading.Lock()
+# Per thread, the stages still running.
+running = threading.local()
+
+
+def peak_rss() -> int:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS but kilobytes on Linux.
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def current() -> Stage | None:
+    stack = getattr(running, "stack", [])
+    return stack[-1] if stack else None
+
+
+@contextmanager
+def stage(name: str, parent: Stage | None = None):
+    """Measure the wall time, CPU time and peak memory of the block.
+
+    It's a sub-step of the innermost stage running on this thread, or of
+    `parent` for one started on another thread. CPU time is counted per
+    thread, so a sub-step on another thread adds its CPU time to its parent's.
+    """
+    stack = running.__dict__.setdefault("stack", [])
+    parent = parent or current()
+    record = Stage(name, parent.name if parent else None)
+
+    stack.append(record)
+    start, start_cpu = time.perf_counter(), time.thread_time()
+    try:
+        yield record
+    finally:
+        stack.pop()
+        with stages_lock:
+            record.wall = time.perf_counter() - start
+            record.cpu += time.thread_time() - start_cpu
+            record.peak_rss = peak_rss()
+            stages.append(record)
+            if parent and parent not in stack:
+                parent.cpu += record.cpu
+
+
+def adopt(record: Stage, parent: Stage | None):
+    """Add a stage measured in another process, as a sub-step of `parent`."""
+    with stages_lock:
+        record.parent = parent.name if parent else None
+        stages.append(record)
+        if parent:
+            parent.cpu += record.cpu
+
+
+def rows(rows_in: int | None = None, rows_out: int | None = None):
+    """Note the rows read and written by the innermost stage on this thread."""
+    record = current()
+    if record is None:
+        return
+    if rows_in is not None:
+        record.rows_in = rows_in
+    if rows_out is not None:
+        record.rows_out = rows_out
+
+
+def save_history(started: str, wall: float, records: list[Stage]):
+    history_path.parent.mkdir(parents=True, exist_ok=True)
+    with history_path.open("a") as f:
+        f.write(
+            json.dumps(
+                {
+                    "started": started,
+                    "wall": round(wall, 3),
+                    "stages": [
+                        {
+                            **asdict(record),
+                            "wall": round(record.wall, 3),
+                            "cpu": round(record.cpu, 3),
+                        }
+                        for record in records
+                    ],
+                }
+            )
+            + "\n"
+        )
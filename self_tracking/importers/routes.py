@@ -1,5 +1,6 @@
 import gzip
-from yaspin import yaspin
+from self_tracking.importers import metrics
+from self_tracking.importers.status import status
 from self_tracking.dirs import diary_dir, icloud_dir
 
 import_dir = icloud_dir / "Health/Routes"
@@ -7,7 +8,7 @@ export_dir = diary_dir / "data/routes"
 
 
 def main():
-    with yaspin(text="GPX routes") as spinner:
+    with status("GPX routes") as spinner:
         count = 0
 
         for import_file in import_dir.glob("*.gpx"):
@@ -22,6 +23,7 @@ def main():
                 f_out.writelines(f_in)
                 count += 1
 
+        metrics.rows(rows_out=count)
         spinner.text += f" ({count} routes)"
         spinner.ok("✔")
 
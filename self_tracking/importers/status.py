@@ -0,0 +1,38 @@
+from contextlib import contextmanager
+import threading
+from yaspin import yaspin
+
+# The line in the live display that each importer thread reports to, when run
+# together from `all`.
+current = threading.local()
+
+
+class Line:
+    """An importer's line in the live display, standing in for its spinner."""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.symbol: str | None = None
+        self.notes: list[str] = []
+
+    def ok(self, symbol: str):
+        self.symbol = symbol
+
+    def fail(self, symbol: str):
+        self.symbol = symbol
+
+    def write(self, text: str):
+        self.notes.append(text)
+
+
+@contextmanager
+def status(text: str):
+    """A spinner for an importer, or its line in the live display when it's
+    being run from `all`. Either way it takes `text +=`, `ok` and `write`."""
+    line = getattr(current, "line", None)
+    if line is None:
+        with yaspin(text=text) as spinner:
+            yield spinner
+    else:
+        line.text = text
+        yield line
@@ -1,7 +1,8 @@
 from self_tracking.dirs import diary_dir, downloads_dir
 import numpy as np
 import pandas as pd
-from yaspin import yaspin
+from self_tracking.importers import fingerprints, metrics
+from self_tracking.importers.status import status
 
 fresh_path = downloads_dir / "strong_workouts.csv"
 export_path = diary_dir / "data/exports/strong.csv"
@@ -21,7 +22,7 @@ def parse_duration(value: str):
 
 
 def main():
-    with yaspin(text="Strong") as spinner:
+    with status("Strong") as spinner:
         if not fresh_path.exists():
             spinner.text += " (skipped)"
             spinner.ok("→")
@@ -29,6 +30,12 @@ def main():
 
         fresh_path.rename(export_path)
 
+        prints = fingerprints.changed("strong", [export_path])
+        if prints is None:
+            spinner.text += " (unchanged)"
+            spinner.ok("→")
+            return
+
         df = pd.read_csv(export_path, parse_dates=["Date"])
 
         df = pd.DataFrame(
@@ -55,6 +62,8 @@ def main():
         workouts_df.to_csv(workouts_path, sep="\t", index=False)
 
         df.to_csv(exercises_path, sep="\t", index=False)
+        metrics.rows(rows_in=df.shape[0], rows_out=workouts_df.shape[0] + df.shape[0])
+        fingerprints.record("strong", prints)
 
         spinner.ok("✔")
 
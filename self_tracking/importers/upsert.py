@@ -0,0 +1,152 @@
+from dataclasses import dataclass
+import json
+from pathlib import Path
+from typing import Callable
+import numpy as np
+import pandas as pd
+from self_tracking.atomic import write_atomic
+from self_tracking.dirs import cache_dir, diary_dir
+
+index_dir = cache_dir / "tsv-keys"
+
+
+@dataclass(frozen=True)
+class Dataset:
+    """A TSV under the diary's data dir that rows are only ever added to.
+
+    The keys already in the file and its greatest `sort_by` value are kept
+    in an index under the cache dir, so new rows can be checked and appended
+    without reading the file. The index is rebuilt from the file whenever the
+    file changes under it.
+
+    Rows are compared as the text they'd be written as, and rows already in the
+    file win over new ones with the same key. New rows may leave out some of
+    the file's columns, which are written empty.
+    """
+
+    name: str
+    keys: list[str]
+    sort_by: str | None = None
+    # Turns the text of the `sort_by` column into something that sorts right,
+    # for columns where the text alone doesn't.
+    sort_key: Callable[[pd.Series], pd.Series] | None = None
+
+    @property
+    def file(self) -> Path:
+        return diary_dir / f"data/{self.name}.tsv"
+
+    @property
+    def index_file(self) -> Path:
+        return index_dir / f"{self.name}.json"
+
+    def ordering(self, values: list[str]) -> np.ndarray:
+        series = pd.Series(values, dtype=str)
+        return (self.sort_key(series) if self.sort_key else series).to_numpy()
+
+    def build_index(self) -> dict:
+        header, *rows = self.file.read_text().splitlines()
+        columns = header.split("\t")
+        key_cols = [columns.index(key) for key in self.keys]
+        rows = [row.split("\t") for row in rows]
+
+        last = None
+        if self.sort_by and rows:
+            col = columns.index(self.sort_by)
+            values = [row[col] for row in rows]
+            last = values[int(np.argmax(self.ordering(values)))]
+
+        return {
+            "columns": columns,
+            "keys": self.keys,
+            "sort_by": self.sort_by,
+            "last": last,
+            "rows": ["\t".join(row[i] for i in key_cols) for row in rows],
+        }
+
+    def load_index(self) -> dict:
+        stat = self.file.stat()
+        version = [stat.st_mtime_ns, stat.st_size]
+        if self.index_file.exists():
+            index = json.loads(self.index_file.read_text())
+            if (
+                index["version"] == version
+                and index["keys"] == self.keys
+                and index["sort_by"] == self.sort_by
+            ):
+                return index
+
+        index = self.build_index()
+        self.save_index(index)
+        return index
+
+    def save_index(self, index: dict):
+        stat = self.file.stat()
+        index["version"] = [stat.st_mtime_ns, stat.st_size]
+        write_atomic(self.index_file, json.dumps(index))
+
+    def last(self) -> str | None:
+        """The text of the greatest `sort_by` value in the file."""
+        return self.load_index()["last"]
+
+    def upsert(self, df: pd.DataFrame, **to_csv_kwargs) -> int:
+        """Add the rows of `df` whose keys aren't in the file yet, with one
+        write, and return how many were added.
+
+        New rows are appended if they all sort after the file's last row, or
+        else the file is rewritten in `sort_by` order.
+        """
+        if not self.file.exists():
+            self.file.write_text("\t".join(df.columns) + "\n")
+
+        index = self.load_index()
+        unknown = set(df.columns) - set(index["columns"])
+        if unknown or not set(self.keys) <= set(df.columns):
+            raise Exception(
+                f"Columns of {self.name} don't match: {list(df.columns)} != {index['columns']}"
+            )
+        df = df.reindex(columns=index["columns"])
+
+        key_cols = [index["columns"].index(key) for key in self.keys]
+        existing = set(index["rows"])
+        new_rows = []
+        text = df.to_csv(sep="\t", index=False, header=False, **to_csv_kwargs)
+        for row in text.splitlines():
+            fields = row.split("\t")
+            key = "\t".join(fields[i] for i in key_cols)
+            if key not in existing:
+                existing.add(key)
+                index["rows"].append(key)
+                new_rows.append(row)
+
+        if not new_rows:
+            return 0
+
+        append = True
+        if self.sort_by:
+            col = index["columns"].index(self.sort_by)
+            values = [row.split("\t")[col] for row in new_rows]
+            order = self.ordering(values)
+            append = bool((order[1:] >= order[:-1]).all())
+            if index["last"] is not None:
+                last = self.ordering([index["last"]])[0]
+                append = append and bool((order >= last).all())
+
+        if append:
+            with self.file.open("rb+") as f:
+                f.seek(-1, 2)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+                f.write(("\n".join(new_rows) + "\n").encode())
+        else:
+            header, *rows = self.file.read_text().splitlines()
+            rows += new_rows
+            values = [row.split("\t")[col] for row in rows]
+            order = np.argsort(self.ordering(values), kind="stable")
+            write_atomic(
+                self.file, "\n".join([header, *(rows[i] for i in order)]) + "\n"
+            )
+
+        if self.sort_by:
+            index["last"] = values[-1] if append else values[order[-1]]
+        self.save_index(index)
+        return len(new_rows)
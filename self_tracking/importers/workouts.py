@@ -1,18 +1,43 @@
-from self_tracking.dirs import diary_dir, icloud_dir
-from yaspin import yaspin
+from self_tracking.dirs import icloud_dir
+from self_tracking.importers.upsert import Dataset
+from self_tracking.importers import fingerprints, metrics
+from self_tracking.importers.status import status
 import pandas as pd
 
 import_dir = icloud_dir / "Health/Workouts"
-export_dir = diary_dir / "data/workouts"
+
+columns = {
+    "cycling": ["start", "duration", "distance", "calories"],
+    "strength": ["start", "duration"],
+    "running": ["start", "duration", "distance", "calories"],
+}
+datasets = {name: Dataset(f"workouts/{name}", keys=["start"]) for name in columns}
+
+
+def upsert_workouts(name: str, group: pd.DataFrame):
+    workout_df = group[columns[name]].copy()
+    workout_df["duration"] = workout_df.duration.apply(lambda x: f"{x:.4f}")
+    if "distance" in workout_df:
+        workout_df["distance"] = workout_df.distance.apply(lambda x: f"{x:.2f}")
+    return datasets[name].upsert(workout_df)
 
 
 def main():
-    with yaspin(text="Workouts") as spinner:
+    with status("Workouts") as spinner:
         count = 0
 
         import_file = sorted(import_dir.glob("*.txt"))[-1]
 
+        # The TSVs too, since Apple Health and Strong rewrite them and may drop
+        # rows added here.
+        sources = [import_file, *(dataset.file for dataset in datasets.values())]
+        if fingerprints.changed("workouts", sources) is None:
+            spinner.text += " (unchanged)"
+            spinner.ok("→")
+            return
+
         df = pd.read_csv(import_file)
+        metrics.rows(rows_in=df.shape[0])
 
         df["start"] = (
             pd.to_datetime(df.Date.replace(" - .*", "", regex=True))
@@ -33,42 +58,10 @@ def main():
         for workout_type, group in df.groupby("Activity"):
             match workout_type:
                 case "Cycling":
-                    filepath = export_dir / "cycling.tsv"
-
-                    workout_df = pd.read_table(filepath)
-                    size_before = workout_df.shape[0]
-
-                    workout_df = pd.concat(
-                        [
-                            workout_df,
-                            group[["start", "duration", "distance", "calories"]],
-                        ]
-                    )
-                    workout_df["duration"] = workout_df.duration.apply(
-                        lambda x: f"{x:.4f}"
-                    )
-                    workout_df["distance"] = workout_df.distance.apply(
-                        lambda x: f"{x:.2f}"
-                    )
-                    workout_df = workout_df.drop_duplicates("start")
-
-                    count += workout_df.shape[0] - size_before
-                    workout_df.to_csv(filepath, sep="\t", index=False)
+                    count += upsert_workouts("cycling", group)
 
                 case "Traditional Strength Training (Indoor)":
-                    filepath = export_dir / "strength.tsv"
-
-                    workout_df = pd.read_table(filepath)
-                    size_before = workout_df.shape[0]
-
-                    workout_df = pd.concat([workout_df, group[["start", "duration"]]])
-                    workout_df["duration"] = workout_df.duration.apply(
-                        lambda x: f"{x:.4f}"
-                    )
-                    workout_df = workout_df.drop_duplicates("start")
-
-                    count += workout_df.shape[0] - size_before
-                    workout_df.to_csv(filepath, sep="\t", index=False)
+                    count += upsert_workouts("strength", group)
 
                 case "Walking":
                     pass
@@ -78,31 +71,13 @@ def main():
                     pass
 
                 case "Running":
-                    filepath = export_dir / "running.tsv"
-
-                    workout_df = pd.read_table(filepath)
-                    size_before = workout_df.shape[0]
-
-                    workout_df = pd.concat(
-                        [
-                            workout_df,
-                            group[["start", "duration", "distance", "calories"]],
-                        ]
-                    )
-                    workout_df["duration"] = workout_df.duration.apply(
-                        lambda x: f"{x:.4f}"
-                    )
-                    workout_df["distance"] = workout_df.distance.apply(
-                        lambda x: f"{x:.2f}"
-                    )
-                    workout_df = workout_df.drop_duplicates("start")
-
-                    count += workout_df.shape[0] - size_before
-                    workout_df.to_csv(filepath, sep="\t", index=False)
+                    count += upsert_workouts("running", group)
 
                 case _:
                     raise Exception(f"Unknown workout type: {workout_type}")
 
+        fingerprints.record("workouts", fingerprints.take(sources))
+        metrics.rows(rows_out=count)
         spinner.text += f" ({count} workouts)"
         spinner.ok("✔")
 
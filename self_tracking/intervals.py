@@ -0,0 +1,62 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+
+@dataclass(frozen=True)
+class Intervals:
+    """Half-open [start, end) intervals, sorted once so the time they cover
+    inside any number of windows comes from prefix sums.
+
+    Up to a time t they cover the sum of (t - start) over starts before t, less
+    the sum of (t - end) over ends before t. Each is a binary search into the
+    sorted endpoints plus a lookup into their running totals.
+    """
+
+    # Endpoints are stored relative to the earliest start so the running
+    # totals stay small and lose less to rounding.
+    origin: float
+    starts: np.ndarray
+    ends: np.ndarray
+    start_sums: np.ndarray
+    end_sums: np.ndarray
+
+    @classmethod
+    def of(cls, starts, ends) -> "Intervals":
+        starts = np.asarray(starts, dtype=float)
+        ends = np.asarray(ends, dtype=float)
+
+        # Empty or backwards intervals cover nothing.
+        keep = ends > starts
+        starts, ends = starts[keep], ends[keep]
+
+        origin = float(starts.min()) if len(starts) else 0.0
+        starts = np.sort(starts - origin)
+        ends = np.sort(ends - origin)
+        return cls(
+            origin=origin,
+            starts=starts,
+            ends=ends,
+            start_sums=np.concatenate([[0.0], starts.cumsum()]),
+            end_sums=np.concatenate([[0.0], ends.cumsum()]),
+        )
+
+    def covered(self, t) -> np.ndarray:
+        """Time covered before each of `t`."""
+        t = np.asarray(t, dtype=float) - self.origin
+        started = np.searchsorted(self.starts, t)
+        ended = np.searchsorted(self.ends, t)
+        return (started * t - self.start_sums[started]) - (
+            ended * t - self.end_sums[ended]
+        )
+
+    def overlap(self, lo, hi) -> np.ndarray:
+        """Time covered inside each [lo[i], hi[i]) window.
+
+        `lo` may hold a single value to measure every window from a common
+        origin. Windows with hi before lo cover nothing.
+        """
+        lo, hi = np.broadcast_arrays(
+            np.asarray(lo, dtype=float), np.asarray(hi, dtype=float)
+        )
+        return np.clip(self.covered(hi) - self.covered(lo), 0, None)